@@ -0,0 +1,165 @@
+import logging
+from datetime import datetime
+from scrapy import signals
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from twisted.internet import defer, threads
+from .frontier import job_id
+from .models import CrawlCheckpoint, release_engine, shared_engine
+from .pipelines import rows_committed, rows_failed, rows_flushing
+
+logger = logging.getLogger(__name__)
+
+LATEST_JOB_QUERY = text("""
+    SELECT job FROM crawl_checkpoints
+    WHERE spider = :spider
+    GROUP BY job
+    HAVING bool_or(NOT done)
+    ORDER BY max(updated_at) DESC
+    LIMIT 1
+""")
+STATE_QUERY = text("""
+    SELECT seed, page, next_url, done, pending, started_at
+    FROM crawl_checkpoints WHERE job = :job
+""")
+EMITTED_QUERY = text("""
+    SELECT natural_key FROM market_entries
+    WHERE updated_at >= :since AND natural_key = ANY(:keys)
+""")
+CLEAR_QUERY = text("""
+    UPDATE crawl_checkpoints SET pending = pending - CAST(:keys AS text[]), updated_at = now()
+    WHERE job = :job AND pending ?| CAST(:keys AS text[])
+""")
+
+class SeedState:
+    def __init__(self, page, next_url, done, pending):
+        self.page = page
+        self.next_url = next_url
+        self.done = done
+        self.pending = pending
+
+# Per-seed progress of a listing crawl: the last listing page handled, the URL of the
+# next one and, by natural key, the cards whose row is not committed yet (profile still
+# to fetch, or item still in the pipeline buffer); keys leave once PostgresPipeline
+# reports their batch written. A resumed run (CRAWL_RESUME=1) continues each seed from
+# its next page and redoes only the pending cards that have not reached market_entries
+# since the job started.
+class CrawlCheckpoints:
+    def __init__(self, crawler):
+        s = crawler.settings
+        self.crawler = crawler
+        self.run_id = s.get("CRAWL_JOB_ID")
+        self.resume = s.getbool("CRAWL_RESUME")
+        self.states = {}
+        self.writes = defer.succeed(None)
+        # pending keys saved for this job; the keys of each batch the pipeline has in flight
+        self.outstanding = set()
+        self.epochs = {}
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(self.rows_flushing, signal=rows_flushing)
+        crawler.signals.connect(self.rows_failed, signal=rows_failed)
+        crawler.signals.connect(self.rows_committed, signal=rows_committed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("CHECKPOINT_ENABLED"):
+            return None
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        self.spider_name = spider.name
+        self.stats = self.crawler.stats
+        self.engine = shared_engine()
+        run_id = self.run_id
+        with self.engine.connect() as conn:
+            # compared against market_entries.updated_at, which the database stamps
+            self.started = conn.execute(text("SELECT now()::timestamp")).scalar()
+            if self.resume and not run_id:
+                job = conn.execute(LATEST_JOB_QUERY, {"spider": spider.name}).scalar()
+                run_id = job.split(":", 1)[1] if job else None
+        self.job = job_id(spider.name, run_id or datetime.utcnow().strftime("%Y%m%d%H%M%S"))
+        if self.resume:
+            self._load()
+        logger.info("Checkpoints: job %s, %d seeds to resume", self.job, len(self.states))
+
+    def spider_closed(self, spider):
+        d = self.writes
+        d.addBoth(lambda _: release_engine(self.engine))
+        return d
+
+    def state(self, seed):
+        return self.states.get(seed)
+
+    def save(self, seed, page, next_url, pending):
+        row = {
+            "job": self.job,
+            "spider": self.spider_name,
+            "seed": seed,
+            "page": page,
+            "next_url": next_url,
+            "done": next_url is None,
+            "pending": pending,
+            "started_at": self.started,
+        }
+        self.outstanding.update(pending)
+        # chained so the checkpoints of one seed land in page order
+        self.writes.addCallback(lambda _: threads.deferToThread(self._write, row))
+        self.writes.addCallbacks(lambda _: self.stats.inc_value("checkpoint/writes"), self._write_failed)
+
+    def rows_flushing(self, cut, keys):
+        self.epochs[cut] = keys
+
+    def rows_failed(self, cut):
+        # the keys stay pending, so a resumed run emits those cards again
+        self.epochs.pop(cut, None)
+
+    def rows_committed(self, cut, idle):
+        keys = [k for c in sorted(c for c in self.epochs if c <= cut) for k in self.epochs.pop(c)]
+        keys = [k for k in keys if k in self.outstanding]
+        if not keys:
+            return
+        self.outstanding.difference_update(keys)
+        self.writes.addCallback(lambda _: threads.deferToThread(self._clear, keys))
+        self.writes.addCallbacks(lambda _: self.stats.inc_value("checkpoint/cleared", len(keys)), self._write_failed)
+
+    def _write(self, row):
+        stmt = insert(CrawlCheckpoint).values(row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["job", "seed"],
+            set_={
+                "page": stmt.excluded.page,
+                "next_url": stmt.excluded.next_url,
+                "done": stmt.excluded.done,
+                "pending": CrawlCheckpoint.pending.op("||")(stmt.excluded.pending),
+                "updated_at": func.now(),
+            },
+        )
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+
+    def _clear(self, keys):
+        with self.engine.begin() as conn:
+            conn.execute(CLEAR_QUERY, {"job": self.job, "keys": keys})
+
+    def _write_failed(self, failure):
+        self.stats.inc_value("checkpoint/write_errors")
+        logger.error("Checkpoint write failed: %s", failure.getErrorMessage())
+
+    def _load(self):
+        with self.engine.connect() as conn:
+            rows = conn.execute(STATE_QUERY, {"job": self.job}).all()
+            if not rows:
+                return
+            self.started = min(r.started_at for r in rows)
+            keys = [k for r in rows for k in (r.pending or {})]
+            emitted = set(conn.execute(EMITTED_QUERY, {"since": self.started, "keys": keys}).scalars()) if keys else set()
+        for r in rows:
+            pending = {k: card for k, card in (r.pending or {}).items() if k not in emitted}
+            self.states[r.seed] = SeedState(r.page, r.next_url, r.done, pending)
+            self.outstanding.update(pending)
+            self.stats.inc_value("checkpoint/resumed_cards", len(pending))
+        self.stats.inc_value("checkpoint/skipped_emitted", len(emitted))
+        if emitted:
+            self._clear(list(emitted))
+        self.stats.set_value("checkpoint/resumed_seeds", sum(1 for s in self.states.values() if not s.done))
@@ -0,0 +1,110 @@
+import re
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+_ws = re.compile(r"\s+")
+_num = re.compile(r"(\d+(?:[.,]\d+)?)")
+_int = re.compile(r"(\d[\d,]*)")
+_share_prefix = re.compile(r"^\s*\d+%?\s*")
+_translator = HTMLTranslator()
+
+def clean(s):
+    if not s:
+        return None
+    return " ".join(str(s).split())
+
+def norm(s):
+    if not s:
+        return None
+    return _ws.sub(" ", s).strip()
+
+def first_num(s):
+    if not s:
+        return None
+    m = _num.search(s)
+    return m.group(1).replace(",", ".") if m else None
+
+def first_int(s):
+    if not s:
+        return None
+    m = _int.search(s)
+    return m.group(1).replace(",", "") if m else None
+
+def to_int(v):
+    try:
+        return int(v)
+    except Exception:
+        return None
+
+def to_float(v):
+    try:
+        return float(str(v).replace(",", "."))
+    except Exception:
+        return None
+
+def strip_share(s):
+    return _share_prefix.sub("", s)
+
+def as_list(v):
+    return [v] if v else []
+
+class Path:
+    # join=None keeps the first match like SelectorList.get(); a string joins every match like " ".join(getall())
+    def __init__(self, expr, join=None, post=None):
+        self.xpath = etree.XPath(expr, smart_strings=False)
+        self.join = join
+        self.post = post
+
+    def __call__(self, node):
+        found = self.xpath(node)
+        if isinstance(found, str):
+            value = found
+        elif self.join is not None:
+            value = self.join.join(found)
+        else:
+            value = found[0] if found else None
+        return self.post(value) if self.post else value
+
+    def all(self, node):
+        found = self.xpath(node)
+        return [found] if isinstance(found, str) else list(found)
+
+def css(query, join=None, post=None):
+    return Path(_translator.css_to_xpath(query), join=join, post=post)
+
+def xpath(expr, join=None, post=None):
+    return Path(expr, join=join, post=post)
+
+class Field:
+    # first truthy value among paths, like `a.get() or b.get()`; many=True collects every match of the first path
+    def __init__(self, *paths, post=None, many=False, each=None):
+        self.paths = paths
+        self.post = post
+        self.many = many
+        self.each = each
+
+    def __call__(self, node):
+        if self.many:
+            value = self.paths[0].all(node)
+            if self.each:
+                value = [self.each(v) for v in value]
+        else:
+            value = None
+            for path in self.paths:
+                value = path(node)
+                if value:
+                    break
+        return self.post(value) if self.post else value
+
+class FieldSet:
+    def __init__(self, fields, cards=None):
+        self.fields = fields
+        self.cards = css(cards).xpath if cards else None
+
+    def extract(self, node, only=None):
+        names = self.fields if only is None else [n for n in self.fields if n in only]
+        return {name: self.fields[name](node) for name in names}
+
+    def iter_cards(self, root):
+        for card in self.cards(root):
+            yield self.extract(card)
@@ -0,0 +1,394 @@
+import base64
+import logging
+import os
+import socket
+import time
+from collections import deque
+from collections.abc import Mapping
+from datetime import datetime
+from scrapy import Request
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.request import request_from_dict
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from twisted.internet import defer, threads
+from twisted.python.failure import Failure
+from .models import FrontierRequest, item_key, release_engine, shared_engine
+from .pipelines import rows_committed, rows_failed, rows_flushing
+
+logger = logging.getLogger(__name__)
+
+# sent by FrontierAckMiddleware once every output of a callback has been scheduled, with the
+# natural keys of the items among them
+request_processed = object()
+
+CLAIM_QUERY = text("""
+    WITH picked AS (
+        SELECT id FROM crawl_frontier
+        WHERE job = :job AND attempts < :max_attempts
+          AND (state = 'queued' OR (state = 'leased' AND lease_until < now()))
+        ORDER BY priority DESC, id
+        LIMIT :n
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE crawl_frontier f
+    SET state = 'leased', worker = :worker, attempts = f.attempts + 1,
+        lease_until = now() + make_interval(secs => :lease), updated_at = now()
+    FROM picked WHERE f.id = picked.id
+    RETURNING f.id, f.priority, f.attempts, f.request
+""")
+PENDING_QUERY = text("""
+    SELECT EXISTS (
+        SELECT 1 FROM crawl_frontier
+        WHERE job = :job AND attempts < :max_attempts
+          AND (state = 'queued' OR (state = 'leased' AND (worker <> :worker OR lease_until < now())))
+    )
+""")
+ACK_QUERY = text("""
+    UPDATE crawl_frontier SET state = 'done', lease_until = NULL, updated_at = now()
+    WHERE id = ANY(:ids) AND worker = :worker AND state = 'leased'
+""")
+REQUEUE_QUERY = text("""
+    UPDATE crawl_frontier SET state = 'queued', lease_until = NULL, updated_at = now()
+    WHERE id = ANY(:ids) AND worker = :worker AND state = 'leased'
+""")
+RELEASE_QUERY = text("""
+    UPDATE crawl_frontier SET state = :state, lease_until = NULL, updated_at = now()
+    WHERE job = :job AND worker = :worker AND state = 'leased'
+""")
+
+def job_id(spider_name, run_id=None):
+    return f"{spider_name}:{run_id or datetime.utcnow().strftime('%Y%m%d')}"
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def encode_request(request, spider):
+    # plain JSON, so a row another worker wrote can only ever come back as a Request
+    d = request.to_dict(spider=spider)
+    d["headers"] = {k.decode("latin-1"): [v.decode("latin-1") for v in vs] for k, vs in d["headers"].items()}
+    d["body"] = base64.b64encode(d["body"]).decode("ascii")
+    d["meta"] = _plain(d["meta"])
+    d["cb_kwargs"] = _plain(d["cb_kwargs"])
+    d["cookies"] = _plain(d["cookies"])
+    if "_class" in d and not d["_class"].startswith("scrapy.http."):
+        raise ValueError(f"crawl frontier cannot store a {d['_class']}")
+    return d
+
+def decode_request(d, spider):
+    d = dict(d, body=base64.b64decode(d["body"]))
+    if "_class" in d and not d["_class"].startswith("scrapy.http."):
+        raise ValueError(f"crawl frontier refuses a {d['_class']}")
+    return request_from_dict(d, spider=spider)
+
+def _plain(v):
+    # meta and cb_kwargs hold items and dicts of scalars; anything else has no JSON form
+    if isinstance(v, Mapping):
+        return {str(k): _plain(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_plain(x) for x in v]
+    if v is None or isinstance(v, (str, int, float, bool)):
+        return v
+    raise TypeError(f"crawl frontier cannot store a {type(v).__name__} in a request")
+
+# Scheduler that keeps the request queue in Postgres so several scraper containers
+# can work one crawl: requests are deduplicated per job by fingerprint, claimed in
+# batches with FOR UPDATE SKIP LOCKED under a lease, and acked once their callback
+# output is scheduled. Leases of a crashed worker expire and are claimed again.
+# None of it runs on the reactor: enqueues and acks are buffered and written from a
+# thread, leases are claimed ahead into a local deque before it runs dry.
+class PostgresFrontier(BaseScheduler):
+    def __init__(self, crawler):
+        s = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.run_id = s.get("CRAWL_JOB_ID")
+        self.worker = s.get("FRONTIER_WORKER_ID") or default_worker_id()
+        self.claim_batch = s.getint("FRONTIER_CLAIM_BATCH", 4)
+        self.lease = s.getfloat("FRONTIER_LEASE_SECONDS", 600)
+        self.max_attempts = s.getint("FRONTIER_MAX_ATTEMPTS", 10)
+        self.poll_interval = s.getfloat("FRONTIER_POLL_INTERVAL", 2.0)
+        self.flush_size = s.getint("FRONTIER_FLUSH_SIZE", 200)
+        self.claimed = deque()
+        self.new = {}
+        self.forced = {}
+        self.acks = []
+        # acks wait until the rows their callbacks produced are committed: the last batch each
+        # key left in, the batches that failed, and the processed requests with their keys.
+        # durable None means no PostgresPipeline is running and requests are acked right away
+        self.durable = None
+        self.flushed_in = {}
+        self.failed_cuts = set()
+        self.waiting = []
+        # requests with a row that failed to write: never acked, back to the queue on close
+        self.lost = []
+        # database work, one statement batch at a time and in order, off the reactor thread
+        self.writes = defer.succeed(None)
+        self.busy = 0
+        self.claiming = False
+        self.checking = False
+        # whether the job had requests left at the last look
+        self.pending = True
+        self.idle_until = 0.0
+        self.claim_after = 0.0
+        crawler.signals.connect(self.request_processed, signal=request_processed)
+        crawler.signals.connect(self.rows_flushing, signal=rows_flushing)
+        crawler.signals.connect(self.rows_failed, signal=rows_failed)
+        crawler.signals.connect(self.rows_committed, signal=rows_committed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def open(self, spider):
+        self.spider = spider
+        self.job = job_id(spider.name, self.run_id)
+        self.fingerprinter = self.crawler.request_fingerprinter
+        self.engine = shared_engine()
+        logger.info("Crawl frontier: job %s, worker %s", self.job, self.worker)
+
+    def close(self, reason):
+        self.flush()
+        # a finished crawl has handled everything it claimed (ignored, failed, filtered) except
+        # the requests whose rows were lost; those, and on any other close all the rest, go back
+        # to the queue for the other workers
+        state = "done" if reason == "finished" else "queued"
+        d = self._run(self._release, state, self.lost)
+        d.addCallbacks(self._released, self._release_failed, callbackArgs=(state, reason))
+        d.addBoth(lambda _: release_engine(self.engine))
+        return d
+
+    def _released(self, released, state, reason):
+        if released:
+            logger.info("Crawl frontier: %d leased requests marked %s on close (%s)", released, state, reason)
+
+    def _release_failed(self, failure):
+        # the leases expire on their own and go back to the other workers then
+        logger.error("Crawl frontier could not release its leases: %s", failure.getErrorMessage())
+
+    def __len__(self):
+        return len(self.claimed) + len(self.new) + len(self.forced)
+
+    def has_pending_requests(self):
+        if self.claimed or self.new or self.forced or self.busy:
+            return True
+        if time.monotonic() < self.idle_until:
+            return False
+        if not self.checking:
+            self.checking = True
+            d = self._run(self._pending)
+            d.addCallback(self._checked)
+            d.addBoth(self._check_done)
+        return self.pending
+
+    def enqueue_request(self, request):
+        fp = self.fingerprinter.fingerprint(request).hex()
+        row = {
+            "job": self.job,
+            "fingerprint": fp,
+            "url": request.url,
+            "priority": request.priority,
+            "request": encode_request(request, self.spider),
+            "state": "queued",
+            "attempts": 0,
+        }
+        # dont_filter also re-queues a request this worker holds (retries);
+        # start requests and links already known to the job stay deduplicated
+        (self.forced if request.dont_filter else self.new)[fp] = row
+        self.pending = True
+        self.idle_until = self.claim_after = 0.0
+        if len(self.new) + len(self.forced) >= self.flush_size:
+            self.flush()
+        return True
+
+    def next_request(self):
+        # refill once half the block is handed out, so the deque rarely waits on a claim
+        if len(self.claimed) <= self.claim_batch // 2 and not self.claiming and time.monotonic() >= self.claim_after:
+            self._claim()
+        return self.claimed.popleft() if self.claimed else None
+
+    def request_processed(self, request, keys=()):
+        fid = request.meta.get("frontier_id")
+        if fid is None:
+            return
+        if self.durable is None:
+            self.acks.append(fid)
+            return
+        self.waiting.append((fid, [k for k in keys if k is not None]))
+        self._settle()
+
+    def rows_flushing(self, cut, keys):
+        for k in keys:
+            if k is not None:
+                self.flushed_in[k] = cut
+
+    def rows_failed(self, cut):
+        self.failed_cuts.add(cut)
+        self._settle()
+
+    def rows_committed(self, cut, idle):
+        self.durable = cut
+        self._settle()
+
+    def _settle(self):
+        waiting = []
+        for fid, keys in self.waiting:
+            cuts = [self.flushed_in.get(k) for k in keys]
+            if any(c in self.failed_cuts for c in cuts):
+                self.lost.append(fid)
+            elif all(c is not None and c <= self.durable for c in cuts):
+                self.acks.append(fid)
+            else:
+                # some rows still in the scraper or the pipeline buffer, or in a batch in flight
+                waiting.append((fid, keys))
+        self.waiting = waiting
+
+    def flush(self):
+        if not (self.new or self.forced or self.acks):
+            return
+        new, forced, acks = list(self.new.values()), list(self.forced.values()), self.acks
+        self.new, self.forced, self.acks = {}, {}, []
+        d = self._run(self._write, new, forced, acks)
+        d.addCallbacks(self._written, self._write_failed, callbackArgs=(new, forced), errbackArgs=(new, forced, acks))
+
+    def _run(self, fn, *args):
+        # chained so enqueues land before the claim that follows them
+        self.busy += 1
+        d = defer.Deferred()
+
+        def call(_):
+            t = threads.deferToThread(fn, *args)
+            t.addBoth(self._ran, d)
+            return t
+
+        self.writes.addCallback(call)
+        self.writes.addErrback(lambda _: None)
+        return d
+
+    def _ran(self, result, d):
+        self.busy -= 1
+        if isinstance(result, Failure):
+            d.errback(result)
+        else:
+            d.callback(result)
+        self._wake()
+
+    def _wake(self):
+        # the engine asks for requests again on its heartbeat; a claim that just landed need not wait for it
+        slot = getattr(self.crawler.engine, "_slot", None)
+        if slot is not None:
+            slot.nextcall.schedule()
+
+    def _write(self, new, forced, acks):
+        stored = acked = 0
+        with self.engine.begin() as conn:
+            if new:
+                stmt = insert(FrontierRequest).values(new).on_conflict_do_nothing(index_elements=["job", "fingerprint"])
+                stored += len(conn.execute(stmt.returning(FrontierRequest.id)).all())
+            if forced:
+                stmt = insert(FrontierRequest).values(forced)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["job", "fingerprint"],
+                    # attempts carries over: retries count against FRONTIER_MAX_ATTEMPTS like expired leases
+                    set_={"request": stmt.excluded.request, "priority": stmt.excluded.priority, "state": "queued",
+                          "worker": None, "lease_until": None, "updated_at": func.now()},
+                    where=(FrontierRequest.worker == self.worker) & (FrontierRequest.state == "leased"),
+                )
+                stored += len(conn.execute(stmt.returning(FrontierRequest.id)).all())
+            if acks:
+                acked = conn.execute(ACK_QUERY, {"ids": acks, "worker": self.worker}).rowcount
+        return stored, acked
+
+    def _written(self, result, new, forced):
+        stored, acked = result
+        self.stats.inc_value("frontier/acked", acked)
+        self.stats.inc_value("frontier/enqueued", stored)
+        self.stats.inc_value("frontier/duplicates", len(new) + len(forced) - stored)
+
+    def _write_failed(self, failure, new, forced, acks):
+        # kept for the next flush; newer rows for the same fingerprint win
+        self.stats.inc_value("frontier/write_errors")
+        logger.error("Crawl frontier write failed: %s", failure.getErrorMessage())
+        for rows, buf in ((new, self.new), (forced, self.forced)):
+            for row in rows:
+                buf.setdefault(row["fingerprint"], row)
+        self.acks.extend(acks)
+
+    def _claim(self):
+        self.claiming = True
+        self.flush()
+        d = self._run(self._claim_rows)
+        d.addCallbacks(self._claimed, self._claim_failed)
+        d.addBoth(self._claim_done)
+
+    def _claim_rows(self):
+        params = {"job": self.job, "worker": self.worker, "n": self.claim_batch, "lease": self.lease, "max_attempts": self.max_attempts}
+        with self.engine.begin() as conn:
+            return conn.execute(CLAIM_QUERY, params).all()
+
+    def _claimed(self, rows):
+        for fid, _, attempts, data in sorted(rows, key=lambda r: (-r[1], r[0])):
+            try:
+                request = decode_request(data, self.spider)
+            except Exception as e:
+                # left leased; its attempts run out and nobody claims it again
+                self.stats.inc_value("frontier/undecodable")
+                logger.error("Crawl frontier request %d cannot be read back: %s", fid, e)
+                continue
+            request.meta["frontier_id"] = fid
+            self.claimed.append(request)
+            if attempts > 1:
+                self.stats.inc_value("frontier/reclaimed")
+        self.stats.inc_value("frontier/claimed", len(rows))
+        if not rows:
+            self.claim_after = time.monotonic() + self.poll_interval
+
+    def _claim_failed(self, failure):
+        self.stats.inc_value("frontier/claim_errors")
+        logger.error("Crawl frontier claim failed: %s", failure.getErrorMessage())
+        self.claim_after = time.monotonic() + self.poll_interval
+
+    def _claim_done(self, _):
+        self.claiming = False
+
+    def _pending(self):
+        with self.engine.connect() as conn:
+            return conn.execute(PENDING_QUERY, {"job": self.job, "worker": self.worker, "max_attempts": self.max_attempts}).scalar()
+
+    def _checked(self, pending):
+        self.pending = pending
+        if not pending:
+            self.idle_until = time.monotonic() + self.poll_interval
+
+    def _check_done(self, result):
+        self.checking = False
+        if isinstance(result, Failure):
+            logger.error("Crawl frontier pending check failed: %s", result.getErrorMessage())
+
+    def _release(self, state, lost):
+        with self.engine.begin() as conn:
+            if lost:
+                requeued = conn.execute(REQUEUE_QUERY, {"ids": lost, "worker": self.worker}).rowcount
+                logger.warning("Crawl frontier: %d requests whose rows were not written go back to the queue", requeued)
+            return conn.execute(RELEASE_QUERY, {"job": self.job, "worker": self.worker, "state": state}).rowcount
+
+class FrontierAckMiddleware:
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("FRONTIER_ENABLED"):
+            raise NotConfigured
+        return cls(crawler)
+
+    async def process_spider_output(self, response, result, spider):
+        keys = []
+        try:
+            async for o in result:
+                if not isinstance(o, Request):
+                    keys.append(item_key(o))
+                yield o
+        finally:
+            self.crawler.signals.send_catch_log(request_processed, request=response.request, keys=keys)
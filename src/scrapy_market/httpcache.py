@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+logger = logging.getLogger(__name__)
+
+# HTTPCACHE_STORAGE backend: gzipped bodies stored once under their sha256 plus one
+# small JSON index entry per request fingerprint, so identical pages share a blob.
+class ResponseStore:
+    def __init__(self, settings):
+        self.root = Path(data_path(settings.get("HTTPCACHE_DIR", "httpcache")))
+        self.mode = settings.get("HTTPCACHE_MODE", "record")
+        self.max_age = settings.getfloat("HTTPCACHE_MAX_AGE_DAYS", 0) * 86400
+        self.max_bytes = settings.getint("HTTPCACHE_MAX_BYTES", 0)
+        self.ignore_codes = set(settings.getlist("HTTPCACHE_IGNORE_HTTP_CODES"))
+
+    def open_spider(self, spider):
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self.stats = spider.crawler.stats
+        logger.info("Response store %s in %s mode", self.root, self.mode)
+
+    def close_spider(self, spider):
+        # a replay must never age out the fixtures it just served
+        if self.mode == "record":
+            self.evict()
+
+    def retrieve_response(self, spider, request):
+        if self.mode == "record":
+            return None
+        entry = self._read_entry(self._fingerprint(request))
+        # stores recorded before those codes were ignored may still hold a 429 or 503
+        if entry is None or entry["status"] in self.ignore_codes:
+            return None
+        try:
+            with gzip.open(self._object_path(entry["body_sha256"]), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        headers = Headers({k.encode("latin-1"): [v.encode("latin-1") for v in vs] for k, vs in entry["headers"].items()})
+        respcls = responsetypes.from_args(headers=headers, url=entry["response_url"], body=body)
+        self.stats.inc_value("httpcache/store_replayed")
+        return respcls(url=entry["response_url"], status=entry["status"], headers=headers, body=body)
+
+    def store_response(self, spider, request, response):
+        digest = hashlib.sha256(response.body).hexdigest()
+        obj = self._object_path(digest)
+        if not obj.exists():
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            self._atomic_write(obj, gzip.compress(response.body))
+        entry = {
+            "url": request.url,
+            "method": request.method,
+            "response_url": response.url,
+            "status": response.status,
+            "headers": {k.decode("latin-1"): [v.decode("latin-1") for v in vs] for k, vs in response.headers.items()},
+            "body_sha256": digest,
+            "timestamp": time.time(),
+        }
+        path = self._index_path(self._fingerprint(request))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._atomic_write(path, json.dumps(entry).encode("utf-8"))
+        self.stats.inc_value("httpcache/store_recorded")
+
+    def evict(self):
+        index = self.root / "index"
+        if not index.exists():
+            return
+        now = time.time()
+        entries = []
+        for p in index.glob("*/*.json"):
+            try:
+                e = json.loads(p.read_text("utf-8"))
+            except (OSError, ValueError):
+                p.unlink(missing_ok=True)
+                continue
+            if self.max_age and now - e["timestamp"] > self.max_age:
+                p.unlink(missing_ok=True)
+                continue
+            entries.append((e["timestamp"], p, e["body_sha256"]))
+        refs = {}
+        for _, _, digest in entries:
+            refs[digest] = refs.get(digest, 0) + 1
+        sizes = {d: self._size(d) for d in refs}
+        total = sum(sizes.values())
+        if self.max_bytes and total > self.max_bytes:
+            for _, p, digest in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                refs[digest] -= 1
+                if refs[digest] == 0:
+                    total -= sizes[digest]
+        removed = 0
+        for obj in (self.root / "objects").glob("*/*.gz"):
+            if refs.get(obj.name[:-3], 0) == 0:
+                obj.unlink(missing_ok=True)
+                removed += 1
+        if removed:
+            logger.info("Response store: evicted %d bodies, %d bytes kept", removed, total)
+
+    def _fingerprint(self, request):
+        return self._fingerprinter.fingerprint(request).hex()
+
+    def _index_path(self, fp):
+        return self.root / "index" / fp[:2] / f"{fp}.json"
+
+    def _object_path(self, digest):
+        return self.root / "objects" / digest[:2] / f"{digest}.gz"
+
+    def _read_entry(self, fp):
+        try:
+            return json.loads(self._index_path(fp).read_text("utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _size(self, digest):
+        try:
+            return self._object_path(digest).stat().st_size
+        except OSError:
+            return 0
+
+    def _atomic_write(self, path, data):
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
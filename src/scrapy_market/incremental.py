@@ -0,0 +1,113 @@
+import logging
+from datetime import datetime, timedelta
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from sqlalchemy import text
+from twisted.internet import defer, threads
+from .models import release_engine, shared_engine
+
+logger = logging.getLogger(__name__)
+
+STATE_QUERY = text("""
+    SELECT DISTINCT ON (profile_url) profile_url, last_crawled_at, etag, last_modified
+    FROM market_entries
+    WHERE profile_url IS NOT NULL
+    ORDER BY profile_url, last_crawled_at DESC NULLS LAST
+""")
+TOUCH_QUERY = text("UPDATE market_entries SET last_crawled_at = :ts WHERE profile_url = ANY(:urls)")
+
+def response_validators(response):
+    etag = response.headers.get(b"ETag")
+    last_modified = response.headers.get(b"Last-Modified")
+    return (etag.decode("latin-1") if etag else None,
+            last_modified.decode("latin-1") if last_modified else None)
+
+class IncrementalMiddleware:
+    touch_batch = 500
+
+    def __init__(self, freshness_hours, stats):
+        self.freshness = timedelta(hours=freshness_hours)
+        self.stats = stats
+        self.known = {}
+        self.touched = []
+        self.flushes = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INCREMENTAL_ENABLED"):
+            raise NotConfigured
+        mw = cls(crawler.settings.getfloat("INCREMENTAL_FRESHNESS_HOURS", 24.0), crawler.stats)
+        crawler.signals.connect(mw.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def spider_opened(self, spider):
+        self.engine = shared_engine()
+        with self.engine.connect() as conn:
+            for url, crawled, etag, last_modified in conn.execute(STATE_QUERY):
+                self.known[url] = (crawled, etag, last_modified)
+        logger.info("Incremental crawl: %d known profiles, freshness window %s", len(self.known), self.freshness)
+
+    def spider_closed(self, spider):
+        # flushes still in flight may put their urls back; the last one goes out after them and
+        # whatever it fails on gets one more try before it is dropped
+        d = defer.DeferredList(list(self.flushes))
+        d.addCallback(lambda _: self._flush_touched())
+        d.addCallback(lambda _: self._flush_touched(last=True))
+        d.addBoth(lambda _: release_engine(self.engine))
+        return d
+
+    def process_request(self, request, spider):
+        url = request.meta.get("incremental_profile")
+        if not url or url not in self.known:
+            return None
+        crawled, etag, last_modified = self.known[url]
+        if crawled is not None and datetime.utcnow() - crawled < self.freshness:
+            self.stats.inc_value("incremental/skipped_fresh")
+            raise IgnoreRequest(f"profile crawled at {crawled:%Y-%m-%d %H:%M}, still fresh")
+        if etag:
+            request.headers.setdefault(b"If-None-Match", etag)
+        if last_modified:
+            request.headers.setdefault(b"If-Modified-Since", last_modified)
+        if etag or last_modified:
+            self.stats.inc_value("incremental/conditional_requests")
+        return None
+
+    def process_response(self, request, response, spider):
+        url = request.meta.get("incremental_profile")
+        if not url or response.status != 304:
+            return response
+        self.stats.inc_value("incremental/not_modified")
+        self.touched.append(url)
+        if len(self.touched) >= self.touch_batch:
+            self._flush_touched()
+        raise IgnoreRequest(f"profile not modified: {url}")
+
+    def _flush_touched(self, last=False):
+        urls, self.touched = self.touched, []
+        d = threads.deferToThread(self._touch, urls)
+        d.addErrback(self._touch_failed, urls, last)
+        self.flushes.add(d)
+        d.addBoth(self._flushed, d)
+        return d
+
+    def _flushed(self, result, d):
+        self.flushes.discard(d)
+        return result
+
+    def _touch_failed(self, failure, urls, last):
+        # kept for the next flush, unless this was the last one; those profiles just look stale
+        # to the next run and get a conditional request again
+        self.stats.inc_value("incremental/touch_errors")
+        logger.error("Touching %d not modified profiles failed: %s", len(urls), failure.getErrorMessage())
+        if last:
+            self.stats.inc_value("incremental/touch_dropped", len(urls))
+            logger.error("Dropping %d not modified profiles; their last_crawled_at stays as it was", len(urls))
+        else:
+            self.touched.extend(urls)
+
+    def _touch(self, urls):
+        if not urls:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(TOUCH_QUERY, {"ts": datetime.utcnow(), "urls": urls})
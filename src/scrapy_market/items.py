@@ -14,3 +14,5 @@ class MarketItem(scrapy.Item):
     services_offered = scrapy.Field()
     case_studies_count = scrapy.Field()
     last_crawled_at = scrapy.Field()
+    etag = scrapy.Field()
+    last_modified = scrapy.Field()
@@ -0,0 +1,40 @@
+import re
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine
+from src.scrapy_market.models import Base, database_url_from_env
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+PARTITION = re.compile(r"^market_entry_changes_\d{6}")
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # the monthly partitions of market_entry_changes (and their copies of its indexes) are made at runtime
+    return not (name and PARTITION.match(name))
+
+def run(connection):
+    context.configure(connection=connection, target_metadata=Base.metadata, compare_type=True, include_object=include_object)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def main():
+    if context.is_offline_mode():
+        context.configure(url=database_url_from_env(), target_metadata=Base.metadata, literal_binds=True)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+    # ensure_schema hands over its own connection (already holding the schema lock)
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run(connection)
+        return
+    engine = create_engine(database_url_from_env())
+    try:
+        with engine.begin() as conn:
+            run(conn)
+    finally:
+        engine.dispose()
+
+main()
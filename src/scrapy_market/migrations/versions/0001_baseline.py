@@ -0,0 +1,83 @@
+"""Tables as create_all left them
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # databases from before migrations already have some or all of these tables
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if "market_entries" not in existing:
+        op.create_table(
+            "market_entries",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("source_url", sa.Text, nullable=False),
+            sa.Column("profile_url", sa.Text),
+            sa.Column("website_url", sa.Text),
+            sa.Column("company_name", sa.Text),
+            sa.Column("natural_key", sa.Text),
+            sa.Column("rating", sa.Float),
+            sa.Column("reviews_count", sa.Integer),
+            sa.Column("hourly_rate", sa.String(100)),
+            sa.Column("min_project_size", sa.String(100)),
+            sa.Column("team_size", sa.String(100)),
+            sa.Column("locations", JSONB),
+            sa.Column("services_offered", JSONB),
+            sa.Column("case_studies_count", sa.Integer),
+            sa.Column("etag", sa.Text),
+            sa.Column("last_modified", sa.Text),
+            sa.Column("last_crawled_at", sa.DateTime(timezone=False)),
+            sa.Column("created_at", sa.DateTime(timezone=False), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=False), server_default=sa.func.now()),
+            sa.UniqueConstraint("natural_key", name="market_entries_natural_key_key"),
+        )
+    else:
+        # columns ensure_schema used to bolt on
+        op.execute("ALTER TABLE market_entries ADD COLUMN IF NOT EXISTS natural_key TEXT UNIQUE")
+        op.execute("ALTER TABLE market_entries ADD COLUMN IF NOT EXISTS etag TEXT")
+        op.execute("ALTER TABLE market_entries ADD COLUMN IF NOT EXISTS last_modified TEXT")
+    if "crawl_frontier" not in existing:
+        op.create_table(
+            "crawl_frontier",
+            sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+            sa.Column("job", sa.Text, nullable=False),
+            sa.Column("fingerprint", sa.String(64), nullable=False),
+            sa.Column("url", sa.Text, nullable=False),
+            sa.Column("priority", sa.Integer, nullable=False),
+            sa.Column("request", sa.LargeBinary, nullable=False),
+            sa.Column("state", sa.String(10), nullable=False),
+            sa.Column("worker", sa.Text),
+            sa.Column("attempts", sa.Integer, nullable=False),
+            sa.Column("lease_until", sa.DateTime(timezone=True)),
+            sa.Column("created_at", sa.DateTime(timezone=False), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=False), server_default=sa.func.now()),
+            sa.UniqueConstraint("job", "fingerprint", name="crawl_frontier_job_fingerprint_key"),
+        )
+        op.create_index("ix_crawl_frontier_claim", "crawl_frontier", ["job", "state", "priority"])
+    if "crawl_checkpoints" not in existing:
+        op.create_table(
+            "crawl_checkpoints",
+            sa.Column("job", sa.Text, primary_key=True),
+            sa.Column("seed", sa.Text, primary_key=True),
+            sa.Column("spider", sa.Text, nullable=False),
+            sa.Column("page", sa.Integer, nullable=False),
+            sa.Column("next_url", sa.Text),
+            sa.Column("done", sa.Boolean, nullable=False),
+            sa.Column("pending", JSONB, nullable=False),
+            sa.Column("started_at", sa.DateTime(timezone=False), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=False), server_default=sa.func.now()),
+        )
+
+def downgrade():
+    op.drop_table("crawl_checkpoints")
+    op.drop_table("crawl_frontier")
+    op.drop_table("market_entries")
@@ -0,0 +1,44 @@
+"""Natural-key backfill and lookup indexes on market_entries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+BTREE = ["source_url", "profile_url", "company_name", "last_crawled_at", "updated_at"]
+GIN = ["locations", "services_offered"]
+
+# models.natural_key() in SQL: the profile url, else "<listing host>|<lowercased name>"
+BACKFILL = r"""
+WITH keyed AS (
+    SELECT id, COALESCE(NULLIF(profile_url, ''),
+                        lower(COALESCE(substring(source_url from '^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)'), ''))
+                        || '|' || lower(regexp_replace(company_name, '^\s+|\s+$', '', 'g'))) AS k
+    FROM market_entries
+    WHERE natural_key IS NULL AND (NULLIF(profile_url, '') IS NOT NULL OR NULLIF(company_name, '') IS NOT NULL)
+), first AS (
+    -- one row per key, and never a key another row already holds
+    SELECT DISTINCT ON (k) id, k FROM keyed
+    WHERE NOT EXISTS (SELECT 1 FROM market_entries m WHERE m.natural_key = keyed.k)
+    ORDER BY k, id
+)
+UPDATE market_entries m SET natural_key = first.k FROM first WHERE m.id = first.id
+"""
+
+def upgrade():
+    # rows written before natural_key existed could not be upserted onto; give them their key
+    op.execute(BACKFILL)
+    for c in BTREE:
+        op.create_index(f"ix_market_entries_{c}", "market_entries", [c], if_not_exists=True)
+    for c in GIN:
+        op.create_index(f"ix_market_entries_{c}", "market_entries", [c], postgresql_using="gin", if_not_exists=True)
+
+def downgrade():
+    for c in BTREE + GIN:
+        op.drop_index(f"ix_market_entries_{c}", table_name="market_entries", if_exists=True)
@@ -0,0 +1,23 @@
+"""Generated columns with the ranges clean_data parses
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+# the expressions live next to the model so the two cannot disagree; changing one of them
+# needs a new migration that drops and re-adds the column
+from src.scrapy_market.models import PARSED_COLUMNS
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # one ALTER so the table is rewritten once; new and updated rows get the values on write
+    adds = ", ".join(f"ADD COLUMN IF NOT EXISTS {c} {kind} GENERATED ALWAYS AS ({e}) STORED" for c, (kind, e) in PARSED_COLUMNS.items())
+    op.execute(f"ALTER TABLE market_entries {adds}")
+
+def downgrade():
+    op.execute("ALTER TABLE market_entries " + ", ".join(f"DROP COLUMN IF EXISTS {c}" for c in PARSED_COLUMNS))
@@ -0,0 +1,110 @@
+"""Append-only change log of market_entries, partitioned by month
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# columns that move on every crawl without the company changing
+UNTRACKED = "ARRAY['id', 'natural_key', 'created_at', 'updated_at', 'last_crawled_at', 'etag', 'last_modified']"
+
+PARTITION = """
+CREATE FUNCTION market_entry_changes_partition(at timestamp) RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    month date := date_trunc('month', at);
+    name text := 'market_entry_changes_' || to_char(month, 'YYYYMM');
+BEGIN
+    IF to_regclass(name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    -- writers of the first rows of a month race to create its partition
+    PERFORM pg_advisory_xact_lock(hashtext('market_entry_changes_partition'));
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF market_entry_changes FOR VALUES FROM (%L) TO (%L)',
+                   name, month, month + interval '1 month');
+END $$
+"""
+
+# statement-level, over the transition tables: one set-based insert per batch however many rows it holds
+LOG_INSERT = f"""
+CREATE FUNCTION market_entries_log_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM market_entry_changes_partition(now()::timestamp);
+    INSERT INTO market_entry_changes (entry_id, changed_at, op, changes)
+    SELECT n.id, now(), 'insert', jsonb_strip_nulls(to_jsonb(n) - {UNTRACKED})
+    FROM new_rows n;
+    RETURN NULL;
+END $$
+"""
+
+LOG_UPDATE = f"""
+CREATE FUNCTION market_entries_log_update() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM market_entry_changes_partition(now()::timestamp);
+    INSERT INTO market_entry_changes (entry_id, changed_at, op, changes)
+    SELECT n.id, now(), 'update', d.changes
+    FROM new_rows n
+    JOIN old_rows o ON o.id = n.id
+    CROSS JOIN LATERAL (
+        SELECT jsonb_object_agg(e.key, e.value) AS changes
+        FROM jsonb_each(to_jsonb(n) - {UNTRACKED}) e
+        WHERE e.value IS DISTINCT FROM to_jsonb(o) -> e.key
+    ) d
+    WHERE d.changes IS NOT NULL;
+    RETURN NULL;
+END $$
+"""
+
+LOG_DELETE = """
+CREATE FUNCTION market_entries_log_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM market_entry_changes_partition(now()::timestamp);
+    INSERT INTO market_entry_changes (entry_id, changed_at, op, changes)
+    SELECT o.id, now(), 'delete', '{}'::jsonb FROM old_rows o;
+    RETURN NULL;
+END $$
+"""
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE market_entry_changes (
+            entry_id integer NOT NULL,
+            changed_at timestamp NOT NULL,
+            op text NOT NULL,
+            changes jsonb NOT NULL
+        ) PARTITION BY RANGE (changed_at)
+    """)
+    op.execute("CREATE INDEX ix_market_entry_changes_entry ON market_entry_changes (entry_id, changed_at)")
+    op.execute("CREATE INDEX ix_market_entry_changes_changed_at ON market_entry_changes (changed_at)")
+    op.execute(PARTITION)
+    # today's rows become the first entry of every company's history
+    op.execute("""
+        SELECT market_entry_changes_partition(m::timestamp)
+        FROM generate_series(date_trunc('month', coalesce((SELECT min(updated_at) FROM market_entries), now())),
+                             now(), interval '1 month') m
+    """)
+    op.execute(f"""
+        INSERT INTO market_entry_changes (entry_id, changed_at, op, changes)
+        SELECT m.id, coalesce(m.updated_at, now()), 'insert', jsonb_strip_nulls(to_jsonb(m) - {UNTRACKED})
+        FROM market_entries m
+    """)
+    for event, fn, tables in [("INSERT", LOG_INSERT, "NEW TABLE AS new_rows"),
+                              ("UPDATE", LOG_UPDATE, "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+                              ("DELETE", LOG_DELETE, "OLD TABLE AS old_rows")]:
+        op.execute(fn)
+        op.execute(f"""
+            CREATE TRIGGER market_entries_log_{event.lower()} AFTER {event} ON market_entries
+            REFERENCING {tables} FOR EACH STATEMENT EXECUTE FUNCTION market_entries_log_{event.lower()}()
+        """)
+
+def downgrade():
+    for event in ["insert", "update", "delete"]:
+        op.execute(f"DROP TRIGGER IF EXISTS market_entries_log_{event} ON market_entries")
+        op.execute(f"DROP FUNCTION IF EXISTS market_entries_log_{event}()")
+    op.execute("DROP TABLE IF EXISTS market_entry_changes")
+    op.execute("DROP FUNCTION IF EXISTS market_entry_changes_partition(timestamp)")
@@ -0,0 +1,22 @@
+"""Frontier requests as JSON instead of pickles
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # a pickle from a table every worker can write is code the reader runs; the queued ones cannot be
+    # converted without loading them, so unfinished jobs start over (their seeds are re-enqueued)
+    op.execute("DELETE FROM crawl_frontier")
+    op.execute("ALTER TABLE crawl_frontier ALTER COLUMN request TYPE jsonb USING NULL")
+
+def downgrade():
+    op.execute("DELETE FROM crawl_frontier")
+    op.execute("ALTER TABLE crawl_frontier ALTER COLUMN request TYPE bytea USING NULL")
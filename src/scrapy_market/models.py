@@ -1,19 +1,67 @@
 import os
+import threading
+from urllib.parse import urlparse
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, Integer, Text, Float, DateTime, String
+from sqlalchemy import Column, Computed, Integer, BigInteger, Boolean, Text, Float, DateTime, String, Index, Table, UniqueConstraint, text
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy import func
+from sqlalchemy import create_engine, func
 
 Base = declarative_base()
 
+# src.scripts.features.mranges/tranges in SQL: the first pattern that matches wins
+MONEY_SPAN = r"\$?\s?(\d[\d,]*)\s*-\s*\$?\s?(\d[\d,]*)"
+MONEY_BELOW = r"<\s*\$?\s?(\d[\d,]*)"
+MONEY_PLUS = r"\$?\s?(\d[\d,]*)\s*\+"
+MONEY = r"\$?\s?(\d[\d,]*)"
+TEAM_SPAN = r"(\d+)\s*-\s*(\d+)"
+TEAM = r"(\d+)"
+
+def _num(t, rx, group):
+    return f"replace((regexp_match({t}, '{rx}'))[{group}], ',', '')::float8"
+
+def _money(col, part):
+    return (f"CASE WHEN {col} ~ '{MONEY_SPAN}' THEN {_num(col, MONEY_SPAN, part + 1)}"
+            f" WHEN {col} ~ '{MONEY_BELOW}' THEN {'0' if part == 0 else _num(col, MONEY_BELOW, 1)}"
+            f" WHEN {col} ~ '{MONEY_PLUS}' THEN {_num(col, MONEY_PLUS, 1)}"
+            f" ELSE {_num(col, MONEY, 1)} END")
+
+def _team(col, part):
+    # commas read as spaces, as in tranges
+    t = f"replace({col}, ',', ' ')"
+    return f"CASE WHEN {t} ~ '{TEAM_SPAN}' THEN {_num(t, TEAM_SPAN, part + 1)} ELSE {_num(t, TEAM, 1)} END"
+
+# stored generated columns: what clean_data derives, kept up to date by Postgres on every write
+PARSED_COLUMNS = {
+    "source": ("text", "lower(coalesce(substring(source_url from '^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)'), ''))"),
+    "hourly_low": ("float8", _money("hourly_rate", 0)),
+    "hourly_high": ("float8", _money("hourly_rate", 1)),
+    "hourly_mid": ("float8", f"({_money('hourly_rate', 0)} + {_money('hourly_rate', 1)}) / 2"),
+    "min_project_usd": ("float8", _money("min_project_size", 0)),
+    "team_low": ("float8", _team("team_size", 0)),
+    "team_high": ("float8", _team("team_size", 1)),
+    "team_mid": ("float8", f"({_team('team_size', 0)} + {_team('team_size', 1)}) / 2"),
+}
+
 class MarketEntry(Base):
     __tablename__ = "market_entries"
+    # keep in step with the migrations; alembic check compares the two
+    __table_args__ = (
+        UniqueConstraint("natural_key", name="market_entries_natural_key_key"),
+        Index("ix_market_entries_source_url", "source_url"),
+        Index("ix_market_entries_profile_url", "profile_url"),
+        Index("ix_market_entries_company_name", "company_name"),
+        Index("ix_market_entries_last_crawled_at", "last_crawled_at"),
+        Index("ix_market_entries_updated_at", "updated_at"),
+        Index("ix_market_entries_locations", "locations", postgresql_using="gin"),
+        Index("ix_market_entries_services_offered", "services_offered", postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     source_url = Column(Text, nullable=False)
     profile_url = Column(Text)
     website_url = Column(Text)
     company_name = Column(Text)
+    natural_key = Column(Text)
 
     rating = Column(Float)
     reviews_count = Column(Integer)
@@ -24,11 +72,104 @@ class MarketEntry(Base):
     locations = Column(JSONB)
     services_offered = Column(JSONB)
     case_studies_count = Column(Integer)
+    etag = Column(Text)
+    last_modified = Column(Text)
 
     last_crawled_at = Column(DateTime(timezone=False))
     created_at = Column(DateTime(timezone=False), server_default=func.now())
     updated_at = Column(DateTime(timezone=False), server_default=func.now(), onupdate=func.now())
 
+    source = Column(Text, Computed(PARSED_COLUMNS["source"][1], persisted=True))
+    hourly_low = Column(Float, Computed(PARSED_COLUMNS["hourly_low"][1], persisted=True))
+    hourly_high = Column(Float, Computed(PARSED_COLUMNS["hourly_high"][1], persisted=True))
+    hourly_mid = Column(Float, Computed(PARSED_COLUMNS["hourly_mid"][1], persisted=True))
+    min_project_usd = Column(Float, Computed(PARSED_COLUMNS["min_project_usd"][1], persisted=True))
+    team_low = Column(Float, Computed(PARSED_COLUMNS["team_low"][1], persisted=True))
+    team_high = Column(Float, Computed(PARSED_COLUMNS["team_high"][1], persisted=True))
+    team_mid = Column(Float, Computed(PARSED_COLUMNS["team_mid"][1], persisted=True))
+
+class FrontierRequest(Base):
+    __tablename__ = "crawl_frontier"
+    __table_args__ = (
+        UniqueConstraint("job", "fingerprint"),
+        Index("ix_crawl_frontier_claim", "job", "state", "priority"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    job = Column(Text, nullable=False)
+    fingerprint = Column(String(64), nullable=False)
+    url = Column(Text, nullable=False)
+    priority = Column(Integer, nullable=False, default=0)
+    request = Column(JSONB, nullable=False)
+    state = Column(String(10), nullable=False, default="queued")
+    worker = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_until = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=False), server_default=func.now())
+    updated_at = Column(DateTime(timezone=False), server_default=func.now(), onupdate=func.now())
+
+class CrawlCheckpoint(Base):
+    __tablename__ = "crawl_checkpoints"
+
+    job = Column(Text, primary_key=True)
+    seed = Column(Text, primary_key=True)
+    spider = Column(Text, nullable=False)
+    page = Column(Integer, nullable=False)
+    next_url = Column(Text)
+    done = Column(Boolean, nullable=False, default=False)
+    pending = Column(JSONB, nullable=False, default=dict)
+    started_at = Column(DateTime(timezone=False), nullable=False)
+    updated_at = Column(DateTime(timezone=False), server_default=func.now(), onupdate=func.now())
+
+# append-only history of market_entries, written by its triggers (migration 0004): one row per
+# insert, update or delete, holding only the tracked fields that changed. Monthly partitions
+# market_entry_changes_YYYYMM are created as rows arrive and are left out of alembic check.
+market_entry_changes = Table(
+    "market_entry_changes", Base.metadata,
+    Column("entry_id", Integer, nullable=False),
+    Column("changed_at", DateTime(timezone=False), nullable=False),
+    Column("op", Text, nullable=False),
+    Column("changes", JSONB, nullable=False),
+    Index("ix_market_entry_changes_entry", "entry_id", "changed_at"),
+    Index("ix_market_entry_changes_changed_at", "changed_at"),
+    postgresql_partition_by="RANGE (changed_at)",
+)
+
+def natural_key(profile_url, source_url, company_name):
+    if profile_url:
+        return profile_url
+    if not company_name:
+        return None
+    host = urlparse(source_url or "").netloc.lower()
+    return f"{host}|{company_name.strip().lower()}"
+
+def item_key(item):
+    return natural_key(item.get("profile_url"), item.get("source_url"), item.get("company_name"))
+
+MIGRATIONS = os.path.join(os.path.dirname(__file__), "migrations")
+
+def migration_config():
+    from alembic.config import Config
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS)
+    return config
+
+def ensure_schema(engine):
+    # brings the database up to the latest migration; a no-op once it is there
+    from alembic import command
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    config = migration_config()
+    head = ScriptDirectory.from_config(config).get_current_head()
+    with engine.begin() as conn:
+        if MigrationContext.configure(conn).get_current_revision() == head:
+            return
+    with engine.begin() as conn:
+        # several workers may start at once; DDL races on the catalog otherwise
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('market_entries_schema'))"))
+        config.attributes["connection"] = conn
+        command.upgrade(config, "head")
+
 def database_url_from_env():
     user = os.getenv("POSTGRES_USER", "market")
     password = os.getenv("POSTGRES_PASSWORD", "marketpass")
@@ -36,3 +177,29 @@ def database_url_from_env():
     port = os.getenv("DB_PORT", "5432")
     db = os.getenv("POSTGRES_DB", "marketdb")
     return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db}"
+
+_engine = None
+_engine_users = 0
+_engine_lock = threading.Lock()
+
+def shared_engine():
+    # one engine, and one connection pool, for every crawler and component in the process;
+    # each caller hands it back with release_engine() and the last one disposes of it
+    global _engine, _engine_users
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(database_url_from_env(), pool_size=int(os.getenv("DB_POOL_SIZE", "5")))
+            ensure_schema(_engine)
+        _engine_users += 1
+        return _engine
+
+def release_engine(engine):
+    global _engine, _engine_users
+    with _engine_lock:
+        if engine is not _engine:
+            engine.dispose()
+            return
+        _engine_users -= 1
+        if _engine_users == 0:
+            _engine.dispose()
+            _engine = None
@@ -1,44 +1,251 @@
+import csv
+import io
+import json
+import logging
+import time
 from datetime import datetime
-from sqlalchemy import create_engine
+from scrapy.utils.log import failure_to_exc_info
+from sqlalchemy import column, func, select, table, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import sessionmaker
-from .models import Base, MarketEntry, database_url_from_env
+from twisted.internet import defer, task, threads
+from twisted.python.threadpool import ThreadPool
+from .models import MarketEntry, natural_key, release_engine, shared_engine
+
+SCALAR_COLUMNS = [
+    "source_url", "profile_url", "website_url", "company_name", "rating", "reviews_count",
+    "hourly_rate", "min_project_size", "team_size", "case_studies_count", "last_crawled_at",
+    "etag", "last_modified",
+]
+LIST_COLUMNS = ["locations", "services_offered"]
+# keeps a multi-row VALUES well under the 65535 bind-parameter limit of Postgres
+UPSERT_CHUNK = 2000
+
+logger = logging.getLogger(__name__)
+
+# rows_flushing(cut, keys): a batch left the buffer, with the natural keys of its rows
+# (None for a row without one); rows_failed(cut): that batch never reached
+# Postgres; rows_committed(cut, idle): every batch up to cut is done, each written or reported
+# failed before, idle meaning nothing is buffered or in flight either
+rows_flushing = object()
+rows_failed = object()
+rows_committed = object()
+
+def entry_values(item):
+    last_crawled = item.get("last_crawled_at")
+    if isinstance(last_crawled, str):
+        try:
+            last_crawled = datetime.fromisoformat(last_crawled)
+        except Exception:
+            last_crawled = None
+    row = {c: item.get(c) for c in SCALAR_COLUMNS}
+    row.update({c: item.get(c) or [] for c in LIST_COLUMNS})
+    row["last_crawled_at"] = last_crawled or datetime.utcnow()
+    row["natural_key"] = natural_key(row["profile_url"], row["source_url"], row["company_name"])
+    return row
+
+COPY_COLUMNS = SCALAR_COLUMNS + LIST_COLUMNS + ["natural_key"]
+COPY_STAGE = "market_entries_stage"
+EMPTY_LIST = text("'[]'::jsonb")
+
+def _on_conflict_update(stmt):
+    entries = MarketEntry.__table__
+    # a missing value from a partial re-crawl must not erase what an earlier crawl found
+    updates = {c: func.coalesce(stmt.excluded[c], entries.c[c]) for c in SCALAR_COLUMNS}
+    # lists come in as [] when the page had none; that is missing too
+    updates.update({c: func.coalesce(func.nullif(stmt.excluded[c], EMPTY_LIST), entries.c[c]) for c in LIST_COLUMNS})
+    updates["updated_at"] = func.now()
+    return stmt.on_conflict_do_update(index_elements=["natural_key"], set_=updates)
+
+def upsert_statement(rows):
+    return _on_conflict_update(insert(MarketEntry.__table__).values(rows))
+
+def merge_stage_statement():
+    stage = table(COPY_STAGE, *[column(c) for c in COPY_COLUMNS])
+    return _on_conflict_update(insert(MarketEntry.__table__).from_select(COPY_COLUMNS, select(*stage.c)))
+
+def _copy_value(v):
+    if v is None:
+        return None
+    if isinstance(v, (list, dict)):
+        return json.dumps(v, ensure_ascii=False)
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return v
+
+def copy_rows(conn, rows):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for r in rows:
+        w.writerow([_copy_value(r.get(c)) for c in COPY_COLUMNS])
+    buf.seek(0)
+    cols = ", ".join(COPY_COLUMNS)
+    cur = conn.connection.dbapi_connection.cursor()
+    try:
+        cur.execute(f"CREATE TEMP TABLE {COPY_STAGE} ON COMMIT DROP AS SELECT {cols} FROM market_entries WITH NO DATA")
+        cur.copy_expert(f"COPY {COPY_STAGE} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cur.close()
+    conn.execute(merge_stage_statement())
 
 class PostgresPipeline:
+    def __init__(self, mode="batch", batch_size=500, flush_interval=5.0, threads=2, queue_size=4, stats=None, signals=None):
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.threads = threads
+        self.queue_size = queue_size
+        self.stats = stats
+        self.signals = signals
+        self.buffer = {}
+        self.pending = set()
+        self.waiters = []
+        self.rows_written = 0
+        self.write_seconds = 0.0
+        self.cut = 0
+        self.in_flight = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = crawler.settings
+        return cls(
+            mode=s.get("DB_WRITE_MODE", "batch"),
+            batch_size=s.getint("DB_BATCH_SIZE", 500),
+            flush_interval=s.getfloat("DB_FLUSH_INTERVAL", 5.0),
+            threads=s.getint("DB_WRITE_THREADS", 2),
+            queue_size=s.getint("DB_WRITE_QUEUE_SIZE", 4),
+            stats=crawler.stats,
+            signals=crawler.signals,
+        )
+
     def open_spider(self, spider):
-        self.engine = create_engine(database_url_from_env())
-        Base.metadata.create_all(self.engine)
+        self.engine = shared_engine()
         self.Session = sessionmaker(bind=self.engine)
-        self.session = self.Session()
+        self.pool = ThreadPool(minthreads=1, maxthreads=self.threads, name="db-writes")
+        self.pool.start()
+        self.last_flush = time.monotonic()
+        self.flusher = None
+        if self.mode in ("batch", "copy") and self.flush_interval > 0:
+            self.flusher = task.LoopingCall(self._flush_if_due)
+            self.flusher.start(self.flush_interval, now=False)
+        self._send(rows_committed, cut=0, idle=True)
 
     def close_spider(self, spider):
+        if self.flusher is not None and self.flusher.running:
+            self.flusher.stop()
+        self.flush()
+        d = defer.DeferredList(list(self.pending), consumeErrors=True)
+        d.addBoth(self._shutdown)
+        return d
+
+    def process_item(self, item, spider):
+        row = entry_values(item)
+        if self.mode == "item" or row["natural_key"] is None:
+            self._submit([row["natural_key"]], self._write_one, row)
+        else:
+            self.buffer[row["natural_key"]] = row
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+            else:
+                self._flush_if_due()
+        if len(self.pending) < self.queue_size:
+            return item
+        # the write queue is full: hold the item until a write finishes, which
+        # keeps the scraper slot busy and makes the engine stop feeding us
+        self._stat_inc("db/backpressure_waits")
+        waiter = defer.Deferred()
+        self.waiters.append(waiter)
+        waiter.addCallback(lambda _: item)
+        return waiter
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            if not self.in_flight:
+                self._send(rows_committed, cut=self.cut, idle=True)
+            return
+        rows = sorted(self.buffer.values(), key=lambda r: r["natural_key"])
+        self.buffer = {}
+        self._submit([r["natural_key"] for r in rows], self._write_copy if self.mode == "copy" else self._write_batch, rows)
+
+    def _flush_if_due(self):
+        if self.flush_interval > 0 and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def _submit(self, keys, fn, *args):
+        from twisted.internet import reactor
+        self.cut += 1
+        self.in_flight.add(self.cut)
+        self._send(rows_flushing, cut=self.cut, keys=keys)
+        d = threads.deferToThreadPool(reactor, self.pool, fn, *args)
+        self.pending.add(d)
+        d.addCallbacks(self._record, self._write_failed, errbackArgs=(self.cut,))
+        d.addBoth(self._finished, d, self.cut)
+        return d
+
+    def _finished(self, result, d, cut):
+        self.pending.discard(d)
+        self.in_flight.discard(cut)
+        done = min(self.in_flight) - 1 if self.in_flight else self.cut
+        self._send(rows_committed, cut=done, idle=not self.in_flight and not self.buffer)
+        while self.waiters and len(self.pending) < self.queue_size:
+            self.waiters.pop(0).callback(None)
+        return result
+
+    def _write_batch(self, rows):
+        started = time.monotonic()
+        with self.engine.begin() as conn:
+            for i in range(0, len(rows), UPSERT_CHUNK):
+                conn.execute(upsert_statement(rows[i:i + UPSERT_CHUNK]))
+        return len(rows), time.monotonic() - started, 1
+
+    def _write_copy(self, rows):
+        started = time.monotonic()
+        with self.engine.begin() as conn:
+            copy_rows(conn, rows)
+        return len(rows), time.monotonic() - started, 1
+
+    def _write_one(self, row):
+        started = time.monotonic()
+        session = self.Session()
         try:
-            self.session.commit()
+            if row["natural_key"] is None:
+                session.add(MarketEntry(**row))
+            else:
+                session.execute(upsert_statement([row]))
+            session.commit()
         finally:
-            self.session.close()
+            session.close()
+        return 1, time.monotonic() - started, 0
 
-    def process_item(self, item, spider):
-        last_crawled = item.get("last_crawled_at")
-        if isinstance(last_crawled, str):
-            try:
-                last_crawled = datetime.fromisoformat(last_crawled)
-            except Exception:
-                last_crawled = datetime.now(datetime.timezone.utc)
-
-        entry = MarketEntry(
-            source_url=item.get("source_url"),
-            profile_url=item.get("profile_url"),
-            website_url=item.get("website_url"),
-            company_name=item.get("company_name"),
-            rating=item.get("rating"),
-            reviews_count=item.get("reviews_count"),
-            hourly_rate=item.get("hourly_rate"),
-            min_project_size=item.get("min_project_size"),
-            team_size=item.get("team_size"),
-            locations=item.get("locations") or [],
-            services_offered=item.get("services_offered") or [],
-            case_studies_count=item.get("case_studies_count"),
-            last_crawled_at=last_crawled or datetime.now(datetime.timezone.utc),
-        )
-        self.session.add(entry)
-        self.session.commit()
-        return item
+    def _write_failed(self, failure, cut):
+        self._stat_inc("db/write_errors")
+        logger.error("Database write failed: %s", failure.getErrorMessage(), exc_info=failure_to_exc_info(failure))
+        # before the rows_committed that covers cut, so nobody takes these rows for saved
+        self._send(rows_failed, cut=cut)
+
+    def _shutdown(self, result):
+        self.pool.stop()
+        release_engine(self.engine)
+        return result
+
+    def _record(self, result):
+        rows, seconds, flushes = result
+        self.rows_written += rows
+        self.write_seconds += seconds
+        if self.stats is None:
+            return
+        self.stats.inc_value("db/rows_written", rows)
+        if flushes:
+            self.stats.inc_value("db/flushes", flushes)
+        self.stats.set_value("db/write_seconds", round(self.write_seconds, 3))
+        if self.write_seconds > 0:
+            self.stats.set_value("db/rows_per_sec", round(self.rows_written / self.write_seconds, 1))
+
+    def _send(self, signal, **kwargs):
+        if self.signals is not None:
+            self.signals.send_catch_log(signal, **kwargs)
+
+    def _stat_inc(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
@@ -6,7 +6,53 @@ NEWSPIDER_MODULE = "src.scrapy_market.spiders"
 ROBOTSTXT_OBEY = True
 DOWNLOAD_DELAY = 1.0
 CONCURRENT_REQUESTS = 4
+DOWNLOADER_MIDDLEWARES = {
+    "src.scrapy_market.incremental.IncrementalMiddleware": 580,
+    "src.scrapy_market.throttle.AdaptiveConcurrencyMiddleware": 800,
+}
+SPIDER_MIDDLEWARES = {
+    "src.scrapy_market.frontier.FrontierAckMiddleware": 10,
+}
 ITEM_PIPELINES = {
     "src.scrapy_market.pipelines.PostgresPipeline": 300,
 }
+# item: one upsert per item; batch: buffered multi-row upserts; copy: COPY into a staging table, then one merge
+DB_WRITE_MODE = os.getenv("DB_WRITE_MODE", "batch")
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "500"))
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "5.0"))
+DB_WRITE_THREADS = int(os.getenv("DB_WRITE_THREADS", "2"))
+DB_WRITE_QUEUE_SIZE = int(os.getenv("DB_WRITE_QUEUE_SIZE", "4"))
+INCREMENTAL_ENABLED = os.getenv("INCREMENTAL", "0") == "1"
+INCREMENTAL_FRESHNESS_HOURS = float(os.getenv("INCREMENTAL_FRESHNESS_HOURS", "24"))
+PROFILE_SKIP_COMPLETE = os.getenv("PROFILE_SKIP_COMPLETE", "1") == "1"
+# record: download everything and store it; replay: serve only from the store, offline; bypass: no store
+HTTPCACHE_MODE = os.getenv("HTTPCACHE_MODE", "bypass")
+HTTPCACHE_ENABLED = HTTPCACHE_MODE in ("record", "replay")
+HTTPCACHE_IGNORE_MISSING = HTTPCACHE_MODE == "replay"
+HTTPCACHE_DIR = os.getenv("HTTPCACHE_DIR", "httpcache")
+HTTPCACHE_STORAGE = "src.scrapy_market.httpcache.ResponseStore"
+HTTPCACHE_POLICY = "scrapy.extensions.httpcache.DummyPolicy"
+# throttled and failed pages are retried, not recorded; replaying them would serve the same error forever
+HTTPCACHE_IGNORE_HTTP_CODES = [429, 500, 502, 503, 504]
+HTTPCACHE_MAX_AGE_DAYS = float(os.getenv("HTTPCACHE_MAX_AGE_DAYS", "30"))
+HTTPCACHE_MAX_BYTES = int(os.getenv("HTTPCACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# AIMD per download slot: +1 concurrency (or -ADAPTIVE_DELAY_STEP delay) every ADAPTIVE_INCREASE_EVERY
+# fast responses, x ADAPTIVE_BACKOFF_FACTOR on 429/503; Retry-After pauses the slot
+ADAPTIVE_CONCURRENCY_ENABLED = os.getenv("ADAPTIVE_CONCURRENCY", "1") == "1"
+ADAPTIVE_MAX_DELAY = float(os.getenv("ADAPTIVE_MAX_DELAY", "60"))
+ADAPTIVE_TARGET_LATENCY = float(os.getenv("ADAPTIVE_TARGET_LATENCY", "5.0"))
+# shared Postgres request queue so several scraper containers can work one crawl job
+FRONTIER_ENABLED = os.getenv("FRONTIER", "0") == "1"
+if FRONTIER_ENABLED:
+    SCHEDULER = "src.scrapy_market.frontier.PostgresFrontier"
+CRAWL_JOB_ID = os.getenv("CRAWL_JOB_ID", "")
+FRONTIER_WORKER_ID = os.getenv("FRONTIER_WORKER_ID", "")
+FRONTIER_CLAIM_BATCH = int(os.getenv("FRONTIER_CLAIM_BATCH", "4"))
+FRONTIER_LEASE_SECONDS = float(os.getenv("FRONTIER_LEASE_SECONDS", "600"))
+# every claim counts, retries included, so keep it above the spiders' RETRY_TIMES
+FRONTIER_MAX_ATTEMPTS = int(os.getenv("FRONTIER_MAX_ATTEMPTS", "10"))
+# per-seed listing progress in crawl_checkpoints; CRAWL_RESUME=1 continues CRAWL_JOB_ID
+# (or the latest unfinished job of the spider) instead of starting every seed at page 1
+CHECKPOINT_ENABLED = os.getenv("CHECKPOINT", "1") == "1"
+CRAWL_RESUME = os.getenv("CRAWL_RESUME", "0") == "1"
 LOG_LEVEL = os.getenv("SCRAPY_LOG_LEVEL", "INFO")
@@ -0,0 +1,74 @@
+import re
+import scrapy
+from ..checkpoint import CrawlCheckpoints
+from ..items import MarketItem
+from ..models import item_key
+
+_page_param = re.compile(r"([?&])page=\d+")
+
+# numeric fields where 0 is a real value; the rest count as missing when empty
+NULLABLE_FIELDS = ("rating", "reviews_count", "case_studies_count")
+
+class MarketSpider(scrapy.Spider):
+    # card fields that make a profile fetch unnecessary; a spider lists the ones its parse_profile can fill
+    profile_required_fields = ("rating", "reviews_count", "hourly_rate", "team_size", "locations", "services_offered")
+    listing_priority = 0
+    profile_priority = 0
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.checkpoints = CrawlCheckpoints.from_crawler(crawler)
+        return spider
+
+    def seed_requests(self, seed, max_pages):
+        state = self.checkpoints.state(seed) if self.checkpoints is not None else None
+        if state is None:
+            yield self.listing_request(seed, seed, 1, max_pages)
+            return
+        for card in state.pending.values():
+            item = MarketItem(card)
+            yield self.profile_or_item(item) if item.get("profile_url") else item
+        if not state.done and state.page < max_pages:
+            yield self.listing_request(state.next_url, seed, state.page + 1, max_pages)
+
+    def listing_request(self, url, seed, page, max_pages):
+        return scrapy.Request(url, callback=self.parse_listing, cb_kwargs={"seed": seed, "page": page, "max_pages": max_pages}, dont_filter=True, priority=self.listing_priority)
+
+    def profile_request(self, item):
+        url = item["profile_url"]
+        return scrapy.Request(url, callback=self.parse_profile, cb_kwargs={"item": item}, meta={"incremental_profile": url}, dont_filter=True, priority=self.profile_priority)
+
+    def card_is_complete(self, item):
+        if not self.settings.getbool("PROFILE_SKIP_COMPLETE", True):
+            return False
+        fields = self.settings.getlist("PROFILE_REQUIRED_FIELDS") or self.profile_required_fields
+        return all(item.get(f) not in (None, "", []) for f in fields)
+
+    def profile_or_item(self, item):
+        if self.card_is_complete(item):
+            self.crawler.stats.inc_value("profile/requests_avoided")
+            return item
+        self.crawler.stats.inc_value("profile/requests")
+        return self.profile_request(item)
+
+    def card_output(self, item, pending):
+        # every card stays pending in its page's checkpoint until its row is committed: a profile
+        # request may not have finished, an item may still sit in the pipeline buffer
+        pending[item_key(item)] = dict(item)
+        return self.profile_or_item(item) if item.get("profile_url") else item
+
+    def checkpoint(self, seed, page, next_url, pending):
+        if self.checkpoints is not None:
+            self.checkpoints.save(seed, page, next_url, pending)
+
+    def fill_missing(self, item, fields, response):
+        missing = [f for f in fields.fields if (item.get(f) is None if f in NULLABLE_FIELDS else not item.get(f))]
+        if missing:
+            item.update(fields.extract(response.selector.root, only=missing))
+
+    def next_page_url(self, seed, next_page):
+        if "page=" in seed:
+            return _page_param.sub(r"\g<1>page=%d" % next_page, seed)
+        sep = "&" if "?" in seed else "?"
+        return f"{seed}{sep}page={next_page}"
@@ -1,8 +1,10 @@
 import os
-import re
 from datetime import datetime
-import scrapy
+from urllib.parse import parse_qs, unquote, urlparse
+from ..extract import Field, FieldSet, as_list, clean, css, first_int, first_num, norm, strip_share, to_float, to_int, xpath
+from ..incremental import response_validators
 from ..items import MarketItem
+from .base import MarketSpider
 
 CATEGORIES_DEFAULT = [
     "https://clutch.co/developers/artificial-intelligence",
@@ -13,15 +15,63 @@ CATEGORIES_DEFAULT = [
     "https://clutch.co/hardware",
     "https://clutch.co/developers/robotics",
 ]
-
-class ClutchAgenciesSpider(scrapy.Spider):
+ADAPTIVE = os.getenv("ADAPTIVE_CONCURRENCY", "1") == "1"
+
+def _services(values):
+    services = [strip_share(s) for s in values if s]
+    return [s for s in services if s]
+
+def _redirect_target(btn):
+    if not btn or "u=" not in btn:
+        return None
+    try:
+        u = parse_qs(urlparse(btn).query).get("u", [None])[0]
+        return unquote(u) if u else None
+    except Exception:
+        return None
+
+CARD_FIELDS = FieldSet({
+    "company_name": Field(css("h3.provider__title a.provider__title-link::text, h3 a.provider__title-link::text, h3 a::text"), post=clean),
+    "profile_url": Field(css("h3.provider__title a.provider__title-link::attr(href), h3 a.provider__title-link::attr(href), h3 a::attr(href)")),
+    "rating": Field(css('meta[itemprop="ratingValue"]::attr(content)'), css(".provider__rating .sg-rating__number::text", post=first_num), post=to_float),
+    "reviews_count": Field(css('meta[itemprop="reviewCount"]::attr(content)'), css(".provider__rating .sg-rating__reviews::text", join=" ", post=first_int), post=to_int),
+    "min_project_size": Field(xpath('normalize-space(.//div[contains(@class,"min-project-size")])'), post=norm),
+    "hourly_rate": Field(xpath('normalize-space(.//div[contains(@class,"hourly-rate")])'), post=norm),
+    "team_size": Field(xpath('normalize-space(.//div[contains(@class,"employees-count")])'), post=norm),
+    "locations": Field(xpath('normalize-space(.//div[contains(@class,"location")])'), post=lambda v: as_list(norm(v))),
+    "services_offered": Field(css(".provider__services-list .provider__services-list-item::text"), many=True, each=clean, post=_services),
+    "case_studies_count": Field(css(".provider__project-highlight-projects-link::text", join=" "), post=first_int),
+    "website_url": Field(css("a.website-link__item::attr(href)"), post=_redirect_target),
+}, cards="div.provider, li.provider-row, div.provider-row, article.provider")
+
+PROFILE_FIELDS = FieldSet({
+    "company_name": Field(css("h1::text, h1 span::text"), post=clean),
+    "rating": Field(css('meta[itemprop="ratingValue"]::attr(content)'), css(".sg-rating__number::text", post=first_num), post=to_float),
+    "reviews_count": Field(css('meta[itemprop="reviewCount"]::attr(content)'), css(".sg-rating__reviews::text", join=" ", post=first_int), post=to_int),
+    "hourly_rate": Field(xpath('normalize-space(//div[contains(@class,"hourly-rate")])'), post=norm),
+    "min_project_size": Field(xpath('normalize-space(//div[contains(@class,"min-project-size")])'), post=norm),
+    "team_size": Field(xpath('normalize-space(//div[contains(@class,"employees-count")])'), post=norm),
+    "locations": Field(xpath('normalize-space(//div[contains(@class,"location")])'), post=lambda v: as_list(norm(v))),
+    "services_offered": Field(css(".provider__services-list .provider__services-list-item::text"), many=True, each=clean, post=_services),
+    "case_studies_count": Field(css(".provider__project-highlight-projects-link::text", join=" "), post=first_int),
+    "website_url": Field(css("a.website-link__item::attr(href)"), post=_redirect_target),
+})
+
+NEXT_PAGE = css('a[rel="next"]::attr(href), li.pager-next a::attr(href), a.next::attr(href), link[rel="next"]::attr(href)')
+
+class ClutchAgenciesSpider(MarketSpider):
     name = "clutch"
     allowed_domains = ["clutch.co"]
+    # website_url comes from the card's visit-website button when it has one, else from the profile
+    profile_required_fields = ("rating", "reviews_count", "hourly_rate", "min_project_size", "team_size", "locations", "services_offered", "website_url")
     custom_settings = {
         "ROBOTSTXT_OBEY": True,
-        "CONCURRENT_REQUESTS": 2,
+        "CONCURRENT_REQUESTS": 8 if ADAPTIVE else 2,
         "DOWNLOAD_DELAY": 1.0,
-        "AUTOTHROTTLE_ENABLED": True,
+        "AUTOTHROTTLE_ENABLED": not ADAPTIVE,
+        "ADAPTIVE_START_CONCURRENCY": 2,
+        "ADAPTIVE_MAX_CONCURRENCY": 6,
+        "ADAPTIVE_MIN_DELAY": 0.25,
         "RETRY_HTTP_CODES": [403, 429, 500, 502, 503, 504],
         "USER_AGENT": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122 Safari/537.36",
         "DEFAULT_REQUEST_HEADERS": {
@@ -38,148 +88,28 @@ class ClutchAgenciesSpider(scrapy.Spider):
         seeds = [s for s in seeds if s.startswith("http")]
         max_pages = int(os.getenv("MAX_PAGES", "25"))
         for url in seeds:
-            yield scrapy.Request(
-                url=url,
-                callback=self.parse_listing,
-                cb_kwargs={"seed": url, "page": 1, "max_pages": max_pages},
-                dont_filter=True,
-            )
+            for request in self.seed_requests(url, max_pages):
+                yield request
 
     def parse_listing(self, response, seed, page, max_pages):
-        cards = response.css("div.provider, li.provider-row, div.provider-row, article.provider")
-        for card in cards:
-            item = MarketItem()
+        pending = {}
+        for values in CARD_FIELDS.iter_cards(response.selector.root):
+            item = MarketItem(values)
             item["source_url"] = response.url
-
-            name = card.css("h3.provider__title a.provider__title-link::text, h3 a.provider__title-link::text, h3 a::text").get()
-            item["company_name"] = self._clean(name)
-
-            prof = card.css("h3.provider__title a.provider__title-link::attr(href), h3 a.provider__title-link::attr(href), h3 a::attr(href)").get()
-            item["profile_url"] = response.urljoin(prof) if prof else None
-
-            rating = card.css('meta[itemprop="ratingValue"]::attr(content)').get()
-            if not rating:
-                rating = self._first_num(card.css(".provider__rating .sg-rating__number::text").get())
-            item["rating"] = self._to_float(rating)
-
-            reviews = card.css('meta[itemprop="reviewCount"]::attr(content)').get()
-            if not reviews:
-                rv_text = " ".join(card.css(".provider__rating .sg-rating__reviews::text").getall())
-                reviews = self._first_int(rv_text)
-            item["reviews_count"] = self._to_int(reviews)
-
-            item["min_project_size"] = self._norm(card.xpath('normalize-space(.//div[contains(@class,"min-project-size")])').get())
-            item["hourly_rate"] = self._norm(card.xpath('normalize-space(.//div[contains(@class,"hourly-rate")])').get())
-            item["team_size"] = self._norm(card.xpath('normalize-space(.//div[contains(@class,"employees-count")])').get())
-
-            loc = self._norm(card.xpath('normalize-space(.//div[contains(@class,"location")])').get())
-            item["locations"] = [loc] if loc else []
-
-            services = [self._clean(t) for t in card.css(".provider__services-list .provider__services-list-item::text").getall()]
-            services = [re.sub(r"^\s*\d+%?\s*", "", s) for s in services if s]
-            item["services_offered"] = [s for s in services if s]
-
-            cs_text = " ".join(card.css(".provider__project-highlight-projects-link::text").getall())
-            item["case_studies_count"] = self._first_int(cs_text)
-
-            item["website_url"] = None
+            item["profile_url"] = response.urljoin(values["profile_url"]) if values["profile_url"] else None
             item["last_crawled_at"] = datetime.utcnow().isoformat()
 
-            if item.get("profile_url"):
-                yield response.follow(item["profile_url"], callback=self.parse_profile, cb_kwargs={"item": item}, dont_filter=True)
-            else:
-                if item.get("company_name"):
-                    yield item
+            if item.get("profile_url") or item.get("company_name"):
+                yield self.card_output(item, pending)
 
+        nxt = None
         if page < max_pages:
-            nxt = response.css('a[rel="next"]::attr(href), li.pager-next a::attr(href), a.next::attr(href), link[rel="next"]::attr(href)').get()
-            if not nxt:
-                nxt = self._guess_next_url(seed, page + 1)
-            if nxt:
-                yield response.follow(nxt, callback=self.parse_listing, cb_kwargs={"seed": seed, "page": page + 1, "max_pages": max_pages}, dont_filter=True)
+            nxt = NEXT_PAGE(response.selector.root) or self.next_page_url(seed, page + 1)
+            nxt = response.urljoin(nxt)
+            yield self.listing_request(nxt, seed, page + 1, max_pages)
+        self.checkpoint(seed, page, nxt, pending)
 
     def parse_profile(self, response, item):
-        if not item.get("company_name"):
-            item["company_name"] = self._clean(response.css("h1::text, h1 span::text").get())
-
-        if item.get("rating") is None:
-            r = response.css('meta[itemprop="ratingValue"]::attr(content)').get() or self._first_num(response.css(".sg-rating__number::text").get())
-            item["rating"] = self._to_float(r)
-
-        if item.get("reviews_count") is None:
-            rc = response.css('meta[itemprop="reviewCount"]::attr(content)').get() or self._first_int(" ".join(response.css(".sg-rating__reviews::text").getall()))
-            item["reviews_count"] = self._to_int(rc)
-
-        if not item.get("hourly_rate"):
-            item["hourly_rate"] = self._norm(response.xpath('normalize-space(//div[contains(@class,"hourly-rate")])').get())
-
-        if not item.get("min_project_size"):
-            item["min_project_size"] = self._norm(response.xpath('normalize-space(//div[contains(@class,"min-project-size")])').get())
-
-        if not item.get("team_size"):
-            item["team_size"] = self._norm(response.xpath('normalize-space(//div[contains(@class,"employees-count")])').get())
-
-        if not item.get("locations"):
-            loc = self._norm(response.xpath('normalize-space(//div[contains(@class,"location")])').get())
-            item["locations"] = [loc] if loc else []
-
-        if not item.get("services_offered"):
-            services = [self._clean(t) for t in response.css(".provider__services-list .provider__services-list-item::text").getall()]
-            services = [re.sub(r"^\s*\d+%?\s*", "", s) for s in services if s]
-            item["services_offered"] = [s for s in services if s]
-
-        if item.get("case_studies_count") is None:
-            cs_text = " ".join(response.css(".provider__project-highlight-projects-link::text").getall())
-            item["case_studies_count"] = self._first_int(cs_text)
-
-        if not item.get("website_url"):
-            btn = response.css('a.website-link__item::attr(href)').get()
-            if btn and "u=" in btn:
-                from urllib.parse import urlparse, parse_qs, unquote
-                try:
-                    u = parse_qs(urlparse(btn).query).get("u", [None])[0]
-                    item["website_url"] = unquote(u) if u else None
-                except Exception:
-                    item["website_url"] = None
-
+        item["etag"], item["last_modified"] = response_validators(response)
+        self.fill_missing(item, PROFILE_FIELDS, response)
         yield item
-
-    def _guess_next_url(self, seed, next_page):
-        if "page=" in seed:
-            return re.sub(r"([?&])page=\d+", r"\1page=%d" % next_page, seed)
-        sep = "&" if "?" in seed else "?"
-        return f"{seed}{sep}page={next_page}"
-
-    def _clean(self, s):
-        if not s:
-            return None
-        return " ".join(str(s).split())
-
-    def _norm(self, s):
-        if not s:
-            return None
-        return re.sub(r"\s+", " ", s).strip()
-
-    def _first_num(self, s):
-        if not s:
-            return None
-        m = re.search(r"(\d+(?:[.,]\d+)?)", s)
-        return m.group(1).replace(",", ".") if m else None
-
-    def _first_int(self, s):
-        if not s:
-            return None
-        m = re.search(r"(\d[\d,]*)", s)
-        return m.group(1).replace(",", "") if m else None
-
-    def _to_int(self, v):
-        try:
-            return int(v)
-        except Exception:
-            return None
-
-    def _to_float(self, v):
-        try:
-            return float(str(v).replace(",", "."))
-        except Exception:
-            return None
@@ -0,0 +1,131 @@
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_STATUSES = {429, 503}
+
+def retry_after_seconds(response):
+    value = response.headers.get(b"Retry-After")
+    if not value:
+        return None
+    value = value.decode("latin-1").strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class SlotLimits:
+    def __init__(self, concurrency, delay):
+        self.concurrency = concurrency
+        self.delay = delay
+        self.successes = 0
+        self.latency = None
+        self.backoffs = 0
+
+class AdaptiveConcurrencyMiddleware:
+    def __init__(self, crawler):
+        s = crawler.settings
+        if not s.getbool("ADAPTIVE_CONCURRENCY_ENABLED"):
+            raise NotConfigured
+        self.crawler = crawler
+        self.start_concurrency = s.getint("ADAPTIVE_START_CONCURRENCY", 1)
+        self.min_concurrency = s.getint("ADAPTIVE_MIN_CONCURRENCY", 1)
+        self.max_concurrency = s.getint("ADAPTIVE_MAX_CONCURRENCY", 4)
+        self.start_delay = s.getfloat("DOWNLOAD_DELAY")
+        self.min_delay = s.getfloat("ADAPTIVE_MIN_DELAY", 0.0)
+        self.max_delay = s.getfloat("ADAPTIVE_MAX_DELAY", 60.0)
+        self.delay_step = s.getfloat("ADAPTIVE_DELAY_STEP", 0.25)
+        self.backoff_factor = s.getfloat("ADAPTIVE_BACKOFF_FACTOR", 0.5)
+        self.increase_every = s.getint("ADAPTIVE_INCREASE_EVERY", 10)
+        self.target_latency = s.getfloat("ADAPTIVE_TARGET_LATENCY", 5.0)
+        self.limits = {}
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def request_reached_downloader(self, request, spider):
+        key, slot = self._slot(request)
+        if slot is None:
+            return
+        limits = self.limits.get(key)
+        if limits is None:
+            limits = self.limits[key] = SlotLimits(self.start_concurrency, max(self.start_delay, self.min_delay))
+            self._publish(key, limits)
+        # slots are garbage-collected when idle and recreated from the static settings
+        slot.concurrency = limits.concurrency
+        slot.delay = limits.delay
+
+    def process_response(self, request, response, spider):
+        key, slot = self._slot(request)
+        limits = self.limits.get(key)
+        if slot is None or limits is None:
+            return response
+        if response.status in BACKOFF_STATUSES:
+            self._decrease(key, slot, limits, retry_after_seconds(response))
+        elif response.status < 500:
+            latency = request.meta.get("download_latency")
+            if latency is not None:
+                limits.latency = latency if limits.latency is None else 0.8 * limits.latency + 0.2 * latency
+            self._increase(key, slot, limits)
+        return response
+
+    def _increase(self, key, slot, limits):
+        if limits.latency is not None and limits.latency > self.target_latency:
+            limits.successes = 0
+            return
+        limits.successes += 1
+        if limits.successes < self.increase_every:
+            return
+        limits.successes = 0
+        # pay back delay first, then open one more connection
+        if limits.delay > self.min_delay:
+            limits.delay = max(self.min_delay, limits.delay - self.delay_step)
+        elif limits.concurrency < self.max_concurrency:
+            limits.concurrency += 1
+        else:
+            return
+        self._apply(key, slot, limits)
+
+    def _decrease(self, key, slot, limits, retry_after):
+        limits.successes = 0
+        limits.backoffs += 1
+        if limits.concurrency > self.min_concurrency:
+            limits.concurrency = max(self.min_concurrency, int(limits.concurrency * self.backoff_factor))
+        else:
+            limits.delay = min(self.max_delay, max(limits.delay, self.delay_step) / self.backoff_factor)
+        if retry_after:
+            # the downloader only honours lastseen for slots with a delay
+            limits.delay = max(limits.delay, self.delay_step)
+        self._apply(key, slot, limits)
+        if retry_after:
+            # hold the whole slot until the server's Retry-After has passed
+            retry_after = min(retry_after, self.max_delay)
+            slot.lastseen = max(slot.lastseen, time.monotonic() + retry_after - limits.delay)
+        logger.info("Backing off %s: concurrency=%d delay=%.2fs retry_after=%s", key, limits.concurrency, limits.delay, retry_after)
+
+    def _apply(self, key, slot, limits):
+        slot.concurrency = limits.concurrency
+        slot.delay = limits.delay
+        self._publish(key, limits)
+
+    def _publish(self, key, limits):
+        stats = self.crawler.stats
+        stats.set_value(f"adaptive/{key}/concurrency", limits.concurrency)
+        stats.set_value(f"adaptive/{key}/delay", round(limits.delay, 3))
+        stats.set_value(f"adaptive/{key}/backoffs", limits.backoffs)
+        if limits.latency is not None:
+            stats.set_value(f"adaptive/{key}/latency_ms", int(limits.latency * 1000))
+
+    def _slot(self, request):
+        key = request.meta.get("download_slot")
+        if key is None:
+            return None, None
+        return key, self.crawler.engine.downloader.slots.get(key)
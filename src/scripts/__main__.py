@@ -0,0 +1,4 @@
+from src.scripts.cli import main
+
+# the commands live in cli.py: stages started in a process of their own must be importable by name
+main()
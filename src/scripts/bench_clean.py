@@ -0,0 +1,150 @@
+import re
+import sys
+import time
+import numpy as np
+import pandas as pd
+from src.scripts.features import SERVICE_COLUMNS, label, matchers, mranges, services, tranges
+
+HOURLY = ["$25 - $49 / hr", "$50 - $99 / hr", "< $25 / hr", "$100 - $149 / hr", "$200+ / hr", "Undisclosed",
+          "$1,000 - $1,500", "$45", "", None, "Hourly rate: $30-$60", "<$10/hr"]
+PROJECT = ["$1,000+", "$5,000+", "$10,000+", "$25,000+", "$100,000+", "Undisclosed", "< $1,000", "$50,000 - $199,999", "", None]
+SERVICES = ["Artificial Intelligence", "Mobile App Development", "IoT Development", "Web Development", "Custom Software Development",
+            "Machine Learning", "UX/UI Design", "iOS App Development", "Android App Development", "Cloud Consulting & SI",
+            "Natural Language Processing", "Blockchain", "E-Commerce Development", "AR/VR Development", "Internet of Things",
+            "IT Staff Augmentation", "Computer Vision", "Flutter", "BI & Big Data Consulting", "Robotic Process Automation"]
+TEAM = ["2 - 9", "10 - 49", "50 - 249", "250 - 999", "1,000 - 9,999", "10,000+", "Freelancer", "2-9 employees", "", None]
+
+def synthetic(n):
+    rng = np.random.default_rng(7)
+    pick = lambda values: [values[i] for i in rng.integers(0, len(values), n)]
+    return pd.DataFrame({"hourly_rate": pick(HOURLY), "min_project_size": pick(PROJECT), "team_size": pick(TEAM)})
+
+def synthetic_services(n):
+    rng = np.random.default_rng(5)
+    picks = rng.integers(0, len(SERVICES), (n, 4))
+    sizes = rng.integers(0, 5, n)
+    return pd.Series([[SERVICES[j] for j in row[:k]] for row, k in zip(picks, sizes)])
+
+def synthetic_distinct(n):
+    # worst case for the factorized parsers: (almost) every string is different
+    rng = np.random.default_rng(11)
+    a, b = rng.integers(1, 500, n), rng.integers(500, 100_000, n)
+    forms = ["$%d - $%d / hr", "< $%d / hr%.0s", "$%d,%03d+", "%d - %d"]
+    form = rng.integers(0, len(forms), n)
+    rows = [forms[f] % (x, y) if f != 1 else "< $%d / hr" % x for f, x, y in zip(form, a, b)]
+    return pd.DataFrame({"hourly_rate": rows, "min_project_size": rows, "team_size": rows})
+
+# the row-wise parsing clean_data used before mranges/tranges
+
+def mrange(s):
+    if not s: return (None,None)
+    t=str(s).strip()
+    m=re.search(r"\$?\s?(\d[\d,]*)\s*-\s*\$?\s?(\d[\d,]*)",t)
+    if m: return (int(m.group(1).replace(",","")),int(m.group(2).replace(",","")))
+    m=re.search(r"<\s*\$?\s?(\d[\d,]*)",t)
+    if m: return (0,int(m.group(1).replace(",","")))
+    m=re.search(r"\$?\s?(\d[\d,]*)\s*\+",t)
+    if m:
+        v=int(m.group(1).replace(",",""))
+        return (v,v)
+    m=re.search(r"\$?\s?(\d[\d,]*)",t)
+    if m:
+        v=int(m.group(1).replace(",",""))
+        return (v,v)
+    return (None,None)
+
+def trange(s):
+    if not s: return (None,None)
+    t=str(s).replace(","," ")
+    m=re.search(r"(\d+)\s*-\s*(\d+)",t)
+    if m: return (int(m.group(1)),int(m.group(2)))
+    m=re.search(r"(\d+)",t)
+    if m:
+        v=int(m.group(1))
+        return (v,v)
+    return (None,None)
+
+rx_ai = re.compile(r"\b(ai|artificial intelligence|machine learning|ml|computer vision|nlp|natural language processing|deep learning)\b", re.I)
+rx_iot = re.compile(r"\b(iot|internet of things)\b", re.I)
+rx_mobile = re.compile(r"\b(mobile|android|ios|iphone|ipad|flutter|react native|mobile app)\b", re.I)
+
+def has_ai(lst): return any(rx_ai.search(str(x)) for x in lst)
+def has_iot(lst): return any(rx_iot.search(str(x)) for x in lst)
+def has_mobile(lst): return any(rx_mobile.search(str(x)) for x in lst)
+
+def legacy_services(col):
+    return pd.DataFrame({"svc_ai": col.apply(has_ai).astype(int), "svc_iot": col.apply(has_iot).astype(int),
+                         "svc_mobile": col.apply(has_mobile).astype(int)}, index=col.index)
+
+def mid(a,b):
+    if a is None and b is None: return None
+    if a is None: return b
+    if b is None: return a
+    return (a+b)/2
+
+def legacy(df):
+    rates=df["hourly_rate"].apply(mrange)
+    df["hourly_low"]=rates.apply(lambda x:x[0])
+    df["hourly_high"]=rates.apply(lambda x:x[1])
+    df["hourly_mid"]=df.apply(lambda r:mid(r["hourly_low"],r["hourly_high"]),axis=1)
+    mps=df["min_project_size"].apply(mrange)
+    df["min_project_usd"]=mps.apply(lambda x:x[0])
+    trs=df["team_size"].apply(trange)
+    df["team_low"]=trs.apply(lambda x:x[0])
+    df["team_high"]=trs.apply(lambda x:x[1])
+    df["team_mid"]=df.apply(lambda r:mid(r["team_low"],r["team_high"]),axis=1)
+    return df
+
+def vectorized(df):
+    df["hourly_low"],df["hourly_high"]=mranges(df["hourly_rate"])
+    df["hourly_mid"]=(df["hourly_low"]+df["hourly_high"])/2
+    df["min_project_usd"]=mranges(df["min_project_size"])[0]
+    df["team_low"],df["team_high"]=tranges(df["team_size"])
+    df["team_mid"]=(df["team_low"]+df["team_high"])/2
+    return df
+
+def timed(fn, df):
+    started = time.perf_counter()
+    out = fn(df.copy())
+    return out, time.perf_counter() - started
+
+def compare(name, df):
+    new, after = timed(vectorized, df)
+    old, before = timed(legacy, df)
+    pd.testing.assert_frame_equal(old, new)
+    print(f"{name:9} rows={len(df)}  row-wise={before:.2f}s  vectorized={after:.2f}s  x{before / after:.1f}  (outputs identical)")
+
+def compare_services(col):
+    started = time.perf_counter()
+    old = legacy_services(col)
+    before = time.perf_counter() - started
+    label.cache_clear()
+    started = time.perf_counter()
+    new = services(col)
+    after = time.perf_counter() - started
+    pd.testing.assert_frame_equal(old, new[SERVICE_COLUMNS])
+    print(f"services  rows={len(col)}  three regex passes={before:.2f}s  once per distinct string={after:.2f}s  x{before / after:.1f}  (outputs identical)")
+
+# terms of two categories that overlap at the same position must label both
+OVERLAPPING = {"AI": r"machine learning|ai", "MLOps": r"machine learning ops|mlops", "Mobile": r"mobile|mobile ai"}
+
+def check_overlap():
+    rx = matchers(OVERLAPPING)
+    for s, want in [("Machine Learning Ops", [True, True, False]), ("Mobile AI", [True, False, True]),
+                    ("MLOps", [False, True, False]), ("Machine Learning", [True, False, False])]:
+        assert label(s, rx) == want, (s, label(s, rx), want)
+
+def main():
+    # bench_clean [rows]; the distinct-strings case runs on a tenth of the rows
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    df = synthetic(n)
+    compare("typical", df)
+    # the int64 path only shows up when every row parses
+    full = df[df["hourly_rate"].str.contains(r"\d", na=False) & df["team_size"].str.contains(r"\d", na=False) & df["min_project_size"].str.contains(r"\d", na=False)].head(1000)
+    pd.testing.assert_frame_equal(legacy(full.copy()), vectorized(full.copy()))
+    compare("distinct", synthetic_distinct(max(1, n // 10)))
+    check_overlap()
+    compare_services(synthetic_services(n))
+
+if __name__ == "__main__":
+    main()
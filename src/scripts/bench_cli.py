@@ -0,0 +1,32 @@
+import sys
+import time
+import subprocess
+from src.scripts.cli import STAGES
+
+def cold(code, runs):
+    # best wall time of a fresh interpreter running code
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL)
+        took = time.perf_counter() - started
+        best = took if best is None else min(best, took)
+    return best
+
+def main():
+    # bench_cli [runs]: cold start of each python -m src.scripts command up to the point its stage starts working
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    bare = cold("pass", runs)
+    cli = cold("import src.scripts.cli as cli; cli.parser().parse_args(['analyze'])", runs)
+    print(f"{'interpreter':12s} {bare:.3f}s")
+    print(f"{'dispatcher':12s} {cli:.3f}s")
+    separate = 0
+    for name in STAGES:
+        took = cold(f"import src.scripts.cli as cli; cli.stage({name!r})", runs)
+        separate += took if name in ("scrape", "clean", "merge", "analyze") else 0
+        print(f"{name:12s} {took:.3f}s")
+    together = cold("import src.scripts.cli as cli; [cli.stage(s) for s in ('scrape', 'clean', 'merge', 'analyze')]", runs)
+    print(f"{'all':12s} {together:.3f}s  (scrape+clean+merge+analyze started one by one: {separate:.3f}s)")
+
+if __name__ == "__main__":
+    main()
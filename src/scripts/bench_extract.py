@@ -0,0 +1,152 @@
+import gzip
+import re
+import sys
+import time
+from pathlib import Path
+from parsel import Selector
+from src.scrapy_market.spiders import clutch, goodfirms
+
+CLUTCH_CARD = '''<div class="provider"><h3 class="provider__title"><a class="provider__title-link" href="/profile/company-{n}">  Company
+ {n} </a></h3>
+<div class="provider__rating"><meta itemprop="ratingValue" content="{rating}"><span class="sg-rating__number">{rating}</span>
+<span class="sg-rating__reviews">{reviews} reviews</span></div>
+<div class="min-project-size">$5,000+</div><div class="hourly-rate">$25 - $49 / hr</div>
+<div class="employees-count">10 - 49</div><div class="location">Kyiv, Ukraine</div>
+<ul class="provider__services-list"><li class="provider__services-list-item">40% AI Development</li>
+<li class="provider__services-list-item">30% Machine Learning</li><li class="provider__services-list-item"> </li></ul>
+<a class="provider__project-highlight-projects-link">{cases} projects</a>
+<a class="website-link__item" href="https://r.clutch.co/redirect?u=https%3A%2F%2Fcompany{n}.example">Visit Website</a></div>'''
+
+GOODFIRMS_CARD = '''<li class="firm-wrapper" entity-name="Firm {n}"><h3 class="firm-name"><a href="/company/firm-{n}">Firm {n}</a></h3>
+<a class="visit-website web-url" href="https://firm{n}.example">Visit</a>
+<div class="firm-rating"><span class="rating-number">{rating}</span><a href="#review">{reviews} Reviews</a></div>
+<div class="firm-services-list"><div class="firm-pricing"><span>$25 - $49/hr</span></div>
+<div class="firm-employees"><span>50 - 249</span></div><div class="firm-location"><span> Lviv,
+ Ukraine </span></div></div>
+<div class="firm-focus-item-name">Artificial Intelligence</div><div class="firm-focus-item-name">IoT</div></li>'''
+
+def synthetic_page(template, cards, page):
+    body = "".join(template.format(n=page * 1000 + i, rating="4.%d" % (i % 10), reviews=i % 300, cases=i % 12) for i in range(cards))
+    return f"<html><body><nav><a class='next' rel='next' href='?page={page + 1}'>Next</a></nav>{body}</body></html>"
+
+# card parsing exactly as the spiders did it before the shared extraction engine
+
+def _clean(s):
+    if not s:
+        return None
+    return " ".join(str(s).split())
+
+def _norm(s):
+    if not s:
+        return None
+    return re.sub(r"\s+", " ", s).strip()
+
+def _first_num(s):
+    if not s:
+        return None
+    m = re.search(r"(\d+(?:[.,]\d+)?)", s)
+    return m.group(1).replace(",", ".") if m else None
+
+def _first_int(s):
+    if not s:
+        return None
+    m = re.search(r"(\d[\d,]*)", s)
+    return m.group(1).replace(",", "") if m else None
+
+def _to_int(v):
+    try:
+        return int(v)
+    except Exception:
+        return None
+
+def _to_float(v):
+    try:
+        return float(str(v).replace(",", "."))
+    except Exception:
+        return None
+
+def legacy_clutch(sel):
+    out = []
+    for card in sel.css("div.provider, li.provider-row, div.provider-row, article.provider"):
+        item = {}
+        item["company_name"] = _clean(card.css("h3.provider__title a.provider__title-link::text, h3 a.provider__title-link::text, h3 a::text").get())
+        item["profile_url"] = card.css("h3.provider__title a.provider__title-link::attr(href), h3 a.provider__title-link::attr(href), h3 a::attr(href)").get()
+        rating = card.css('meta[itemprop="ratingValue"]::attr(content)').get()
+        if not rating:
+            rating = _first_num(card.css(".provider__rating .sg-rating__number::text").get())
+        item["rating"] = _to_float(rating)
+        reviews = card.css('meta[itemprop="reviewCount"]::attr(content)').get()
+        if not reviews:
+            reviews = _first_int(" ".join(card.css(".provider__rating .sg-rating__reviews::text").getall()))
+        item["reviews_count"] = _to_int(reviews)
+        item["min_project_size"] = _norm(card.xpath('normalize-space(.//div[contains(@class,"min-project-size")])').get())
+        item["hourly_rate"] = _norm(card.xpath('normalize-space(.//div[contains(@class,"hourly-rate")])').get())
+        item["team_size"] = _norm(card.xpath('normalize-space(.//div[contains(@class,"employees-count")])').get())
+        loc = _norm(card.xpath('normalize-space(.//div[contains(@class,"location")])').get())
+        item["locations"] = [loc] if loc else []
+        services = [_clean(t) for t in card.css(".provider__services-list .provider__services-list-item::text").getall()]
+        services = [re.sub(r"^\s*\d+%?\s*", "", s) for s in services if s]
+        item["services_offered"] = [s for s in services if s]
+        item["case_studies_count"] = _first_int(" ".join(card.css(".provider__project-highlight-projects-link::text").getall()))
+        item["website_url"] = clutch._redirect_target(card.css("a.website-link__item::attr(href)").get())
+        out.append(item)
+    return out
+
+def legacy_goodfirms(sel):
+    out = []
+    for c in sel.css("li.firm-wrapper, li.firm-list-item, li.company-list-item, div.firm-card, article.firm-wrapper"):
+        it = {}
+        it["company_name"] = _clean(c.css("h3.firm-name a::text, a.firm-name::text, a.visit-profile::text").get() or c.attrib.get("entity-name"))
+        it["profile_url"] = c.css("h3.firm-name a::attr(href), a.visit-profile::attr(href)").get()
+        it["website_url"] = c.css("a.visit-website.web-url::attr(href)").get()
+        r = c.css(".firm-rating .rating-number::text, .rating-number::text").get() or c.css('meta[itemprop="ratingValue"]::attr(content)').get()
+        it["rating"] = _to_float(r)
+        it["reviews_count"] = _to_int(_first_int(" ".join(c.css(".firm-rating a::text, a[href*='#review']::text, .reviews-count::text, .review-count::text").getall())))
+        it["hourly_rate"] = _norm(c.css(".firm-services-list .firm-pricing span::text, .pricing span::text").get())
+        it["team_size"] = _norm(c.css(".firm-services-list .firm-employees span::text, .employees span::text").get())
+        loc = _norm(c.css(".firm-services-list .firm-location span::text, .location::text").get())
+        it["locations"] = [loc] if loc else []
+        focus = [_clean(x) for x in c.xpath('.//div[contains(@class,"firm-focus-item-name")]/text()').getall()]
+        it["services_offered"] = [x for x in focus if x]
+        out.append(it)
+    return out
+
+SITES = {
+    "clutch": (CLUTCH_CARD, legacy_clutch, clutch.CARD_FIELDS),
+    "goodfirms": (GOODFIRMS_CARD, legacy_goodfirms, goodfirms.CARD_FIELDS),
+}
+
+def load(path):
+    data = Path(path).read_bytes()
+    if path.endswith(".gz"):
+        data = gzip.decompress(data)
+    return data.decode("utf-8", "replace")
+
+def timed(fn, pages, rounds):
+    cards = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages:
+            cards += len(fn(html))
+    return cards / (time.perf_counter() - started)
+
+def main():
+    # bench_extract [clutch|goodfirms] [saved listing pages (.html or .html.gz) ...]
+    args = sys.argv[1:]
+    sites = [args.pop(0)] if args and args[0] in SITES else list(SITES)
+    rounds = 20
+    for site in sites:
+        template, legacy, fields = SITES[site]
+        pages = [load(p) for p in args] or [synthetic_page(template, 40, p) for p in range(1, 26)]
+        old = lambda html: legacy(Selector(text=html))
+        new = lambda html: list(fields.iter_cards(Selector(text=html).root))
+        for html in pages:
+            a, b = old(html), new(html)
+            if a != b:
+                sys.exit(f"{site}: extraction differs\n  legacy: {a[:1]}\n  engine: {b[:1]}")
+        before = timed(old, pages, rounds)
+        after = timed(new, pages, rounds)
+        print(f"{site:10} pages={len(pages):4d} legacy={before:9.0f} cards/s  engine={after:9.0f} cards/s  x{after / before:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from src.scrapy_market.models import database_url_from_env, ensure_schema
+from src.scrapy_market.pipelines import PostgresPipeline, entry_values
+
+PREFIX = "bench://ingest/"
+
+def synthetic_rows(n, tag):
+    rows = []
+    for i in range(n):
+        rows.append(entry_values({
+            "source_url": "https://clutch.co/developers/artificial-intelligence?page=%d" % (i // 50 + 1),
+            "profile_url": f"{PREFIX}{tag}/{i}",
+            "company_name": f"Bench Company {i}",
+            "rating": 4.0 + (i % 10) / 10,
+            "reviews_count": i % 300,
+            "hourly_rate": "$%d - $%d / hr" % (25 + i % 50, 50 + i % 100),
+            "min_project_size": "$%d,000+" % (1 + i % 50),
+            "team_size": "%d - %d" % (10, 49 + i % 200),
+            "locations": [f"City {i % 97}, Country {i % 13}", "Kyiv, Ukraine"],
+            "services_offered": ["Artificial Intelligence", "Mobile App Development", f"Niche {i % 7} \"quoted\", comma"],
+            "case_studies_count": i % 12,
+            "last_crawled_at": datetime.utcnow().isoformat(),
+        }))
+    return rows
+
+def run_mode(pipeline, mode, rows, batch_size):
+    started = time.monotonic()
+    if mode == "item":
+        for r in rows:
+            pipeline._write_one(r)
+    else:
+        write = pipeline._write_copy if mode == "copy" else pipeline._write_batch
+        for i in range(0, len(rows), batch_size):
+            write(rows[i:i + batch_size])
+    return len(rows) / (time.monotonic() - started)
+
+def check_roundtrip(engine, row):
+    with engine.connect() as conn:
+        got = conn.execute(text("SELECT locations, services_offered FROM market_entries WHERE natural_key = :k"), {"k": row["natural_key"]}).one()
+    return list(got[0]) == row["locations"] and list(got[1]) == row["services_offered"]
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    engine = create_engine(database_url_from_env())
+    ensure_schema(engine)
+    pipeline = PostgresPipeline(batch_size=batch_size)
+    pipeline.engine = engine
+    pipeline.Session = sessionmaker(bind=engine)
+    results = {}
+    try:
+        for mode in ["item", "batch", "copy"]:
+            rows = synthetic_rows(n, mode)
+            results[mode] = run_mode(pipeline, mode, rows, batch_size)
+            ok = check_roundtrip(engine, rows[-1])
+            print(f"{mode:6s} {results[mode]:10.1f} rows/s  jsonb_roundtrip={'ok' if ok else 'MISMATCH'}")
+        print(f"copy vs item: {results['copy'] / results['item']:.1f}x, copy vs batch: {results['copy'] / results['batch']:.1f}x")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM market_entries WHERE profile_url LIKE :p"), {"p": PREFIX + "%"})
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
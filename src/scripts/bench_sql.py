@@ -0,0 +1,60 @@
+import math
+import time
+import pandas as pd
+from sqlalchemy import create_engine
+from src.scrapy_market.models import database_url_from_env, ensure_schema
+from src.scripts.clean_data import dbp, fetch, prepare, summarize
+from src.scripts.sql_stats import FILLED, clean_meta, merge_aggregates
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - started
+
+def close(x, y, path=""):
+    if isinstance(x, dict):
+        assert set(x) == set(y), (path, set(x) ^ set(y))
+        for k in x:
+            close(x[k], y[k], f"{path}/{k}")
+    elif isinstance(x, float) or isinstance(y, float):
+        assert (x is None) == (y is None), (path, x, y)
+        if x is not None:
+            assert (math.isnan(x) and math.isnan(y)) or math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-9), (path, x, y)
+    else:
+        assert x == y, (path, x, y)
+
+def pandas_aggregates(df):
+    # what merge_tables works out in pandas: rating median, per-source medians, post-fill quartiles
+    rating = float(df["rating"].median()) if df["rating"].notna().any() else None
+    medians, quartiles = {}, {}
+    for col in FILLED:
+        gmed = df.groupby("source")[col].median()
+        glob = float(df[col].median()) if df[col].notna().any() else None
+        medians[col] = {"group_medians": {str(k): float(v) for k, v in gmed.dropna().items()}, "global_median": glob}
+        filled = df[col].fillna(df["source"].astype(str).map(medians[col]["group_medians"])).fillna(glob)
+        quartiles[col] = (float(filled.quantile(0.25)), float(filled.quantile(0.75)))
+    return rating, medians, quartiles
+
+def main():
+    # bench_sql: clean and merge aggregates in pandas vs Postgres, on the configured database
+    engine = create_engine(database_url_from_env())
+    ensure_schema(engine)
+    engine.dispose()
+    raw, read = timed(fetch)
+    df = prepare(raw, 1)
+    print(f"rows={len(df)}  full table read for pandas: {read:.2f}s")
+
+    local, before = timed(summarize, df)
+    remote, after = timed(clean_meta, df, dbp())
+    close(local, remote)
+    print(f"clean meta      pandas={before:.2f}s  sql={after:.2f}s  (equal within 1e-9)")
+
+    winners = df.drop_duplicates("company_name")
+    local, before = timed(pandas_aggregates, winners)
+    remote, after = timed(merge_aggregates, winners, dbp())
+    close({"rating": local[0], **local[1], **{f"q_{c}": dict(enumerate(local[2][c])) for c in FILLED}},
+          {"rating": remote[0], **remote[1], **{f"q_{c}": dict(enumerate(remote[2][c])) for c in FILLED}})
+    print(f"merge medians   pandas={before:.2f}s  sql={after:.2f}s  winners={len(winners)}  (equal within 1e-9)")
+
+if __name__ == "__main__":
+    main()
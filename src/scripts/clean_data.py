@@ -1,7 +1,12 @@
-import os, re, json, psycopg2, pandas as pd, numpy as np
-from urllib.parse import urlparse
+import os, sys, json, psycopg2, pandas as pd, numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from xml.etree.ElementTree import Element, SubElement, ElementTree
+from src.scripts.features import BOOKKEEPING, PARSED, SERVICE_COLUMNS, VERSION, derive, load, read_state, save, tidy, to_csv, write_state
+from src.scripts.sql_stats import clean_meta, cursor
+from src.scripts.xml_stream import write_columns
+
+# seconds of updated_at re-read before the last watermark on an incremental run
+OVERLAP=int(os.getenv("CLEAN_OVERLAP_SECONDS","600"))
 
 def dbp():
     return dict(user=os.getenv("POSTGRES_USER","market"),
@@ -10,100 +15,48 @@ def dbp():
                 port=os.getenv("DB_PORT","5432"),
                 dbname=os.getenv("POSTGRES_DB","marketdb"))
 
-def fetch():
-    q="""SELECT id,source_url,company_name,rating,reviews_count,hourly_rate,
-                 min_project_size,team_size,last_crawled_at,locations,services_offered
+def fetch(since=None,parsed=False):
+    # parsed: also read the ranges Postgres keeps in generated columns (migration 0003), so
+    # derive() does not parse them again
+    extra="".join(","+c for c in PARSED) if parsed else ""
+    q=f"""SELECT id,source_url,profile_url,website_url,company_name,rating,reviews_count,hourly_rate,
+                 min_project_size,team_size,last_crawled_at,locations,services_offered,updated_at{extra}
          FROM market_entries
-         WHERE company_name IS NOT NULL"""
-    with psycopg2.connect(**dbp()) as c:
-        with c.cursor() as cur:
-            cur.execute(q)
-            cols=[d[0] for d in cur.description]
-            rows=cur.fetchall()
+         WHERE company_name ~ '\\S'"""
+    if since is not None:
+        q+=" AND updated_at >= %(since)s"
+    with cursor(dbp()) as cur:
+        cur.execute(q+" ORDER BY id",{"since":since})
+        cols=[d[0] for d in cur.description]
+        rows=cur.fetchall()
     return pd.DataFrame(rows,columns=cols)
 
-def dmn(u):
-    try: return urlparse(u).netloc.lower()
-    except: return None
-
-def mrange(s):
-    if not s: return (None,None)
-    t=str(s).strip()
-    m=re.search(r"\$?\s?(\d[\d,]*)\s*-\s*\$?\s?(\d[\d,]*)",t)
-    if m: return (int(m.group(1).replace(",","")),int(m.group(2).replace(",","")))
-    m=re.search(r"<\s*\$?\s?(\d[\d,]*)",t)
-    if m: return (0,int(m.group(1).replace(",","")))
-    m=re.search(r"\$?\s?(\d[\d,]*)\s*\+",t)
-    if m:
-        v=int(m.group(1).replace(",",""))
-        return (v,v)
-    m=re.search(r"\$?\s?(\d[\d,]*)",t)
-    if m:
-        v=int(m.group(1).replace(",",""))
-        return (v,v)
-    return (None,None)
-
-def trange(s):
-    if not s: return (None,None)
-    t=str(s).replace(","," ")
-    m=re.search(r"(\d+)\s*-\s*(\d+)",t)
-    if m: return (int(m.group(1)),int(m.group(2)))
-    m=re.search(r"(\d+)",t)
-    if m:
-        v=int(m.group(1))
-        return (v,v)
-    return (None,None)
-
-def mid(a,b):
-    if a is None and b is None: return None
-    if a is None: return b
-    if b is None: return a
-    return (a+b)/2
-
-def norm_list(v):
-    if v is None: return []
-    if isinstance(v,list): return [str(x).strip() for x in v if str(x).strip()]
-    try:
-        x=json.loads(v)
-        if isinstance(x,list): return [str(i).strip() for i in x if str(i).strip()]
-    except: pass
-    s=str(v).strip()
-    return [s] if s else []
-
-rx_ai = re.compile(r"\b(ai|artificial intelligence|machine learning|ml|computer vision|nlp|natural language processing|deep learning)\b", re.I)
-rx_iot = re.compile(r"\b(iot|internet of things)\b", re.I)
-rx_mobile = re.compile(r"\b(mobile|android|ios|iphone|ipad|flutter|react native|mobile app)\b", re.I)
-
-def has_ai(lst): return any(rx_ai.search(str(x)) for x in lst)
-def has_iot(lst): return any(rx_iot.search(str(x)) for x in lst)
-def has_mobile(lst): return any(rx_mobile.search(str(x)) for x in lst)
+def fetch_ids():
+    with psycopg2.connect(**dbp()) as c:
+        with c.cursor() as cur:
+            cur.execute("SELECT id FROM market_entries WHERE company_name ~ '\\S'")
+            return pd.Index([r[0] for r in cur.fetchall()])
 
 def ensure_dirs():
     os.makedirs("outputs",exist_ok=True)
 
 def to_xml(df,path):
-    r=Element("companies")
-    for _,row in df.iterrows():
-        c=SubElement(r,"company")
-        SubElement(c,"company_name").text=str(row.get("company_name",""))
-        SubElement(c,"source").text=str(row.get("source",""))
-        SubElement(c,"rating").text=str(row.get("rating",""))
-        SubElement(c,"reviews_count").text=str(row.get("reviews_count",""))
-        SubElement(c,"hourly_rate").text=str(row.get("hourly_rate",""))
-        SubElement(c,"min_project_size").text=str(row.get("min_project_size",""))
-        SubElement(c,"team_size").text=str(row.get("team_size",""))
-        L=SubElement(c,"locations")
-        for loc in row.get("locations") or []:
-            SubElement(L,"location").text=str(loc)
-        S=SubElement(c,"services")
-        for s in row.get("services_offered") or []:
-            SubElement(S,"service").text=str(s)
-        SubElement(c,"svc_ai").text=str(int(row.get("svc_ai",0)))
-        SubElement(c,"svc_iot").text=str(int(row.get("svc_iot",0)))
-        SubElement(c,"svc_mobile").text=str(int(row.get("svc_mobile",0)))
-        SubElement(c,"source_url").text=str(row.get("source_url",""))
-        SubElement(c,"last_crawled_at").text=str(row.get("last_crawled_at",""))
-    ElementTree(r).write(path,encoding="utf-8",xml_declaration=True)
+    col=lambda c,d="": df[c] if c in df else [d]*len(df)
+    flag=lambda c: df[c].astype(int) if c in df else [0]*len(df)
+    write_columns(path,"companies","company",[
+        ("company_name",col("company_name")),
+        ("source",col("source")),
+        ("rating",col("rating")),
+        ("reviews_count",col("reviews_count")),
+        ("hourly_rate",col("hourly_rate")),
+        ("min_project_size",col("min_project_size")),
+        ("team_size",col("team_size")),
+        ("locations",col("locations",[]),"location"),
+        ("services",col("services_offered",[]),"service"),
+        *[(c,flag(c)) for c in SERVICE_COLUMNS],
+        ("source_url",col("source_url")),
+        ("last_crawled_at",col("last_crawled_at")),
+    ],len(df))
 
 def iqr_outliers_count(x):
     v=pd.to_numeric(x,errors="coerce").dropna()
@@ -126,34 +79,8 @@ def numeric_stats(x):
         "std": float(v.std()) if v.notna().any() else None
     }
 
-def main():
-    ensure_dirs()
-    df=fetch()
-    if df.empty:
-        print("no data"); return
-    df["company_name"]=df["company_name"].astype(str).str.strip()
-    df=df[df["company_name"].notna() & (df["company_name"]!="")]
-    df["source"]=df["source_url"].apply(dmn)
-    df["rating"]=pd.to_numeric(df["rating"],errors="coerce")
-    df["reviews_count"]=pd.to_numeric(df["reviews_count"],errors="coerce").fillna(0).astype(int)
-    df["locations"]=df["locations"].apply(norm_list)
-    df["services_offered"]=df["services_offered"].apply(norm_list)
-    rates=df["hourly_rate"].apply(mrange)
-    df["hourly_low"]=rates.apply(lambda x:x[0])
-    df["hourly_high"]=rates.apply(lambda x:x[1])
-    df["hourly_mid"]=df.apply(lambda r:mid(r["hourly_low"],r["hourly_high"]),axis=1)
-    mps=df["min_project_size"].apply(mrange)
-    df["min_project_usd"]=mps.apply(lambda x:x[0])
-    trs=df["team_size"].apply(trange)
-    df["team_low"]=trs.apply(lambda x:x[0])
-    df["team_high"]=trs.apply(lambda x:x[1])
-    df["team_mid"]=df.apply(lambda r:mid(r["team_low"],r["team_high"]),axis=1)
-    df["svc_ai"]=df["services_offered"].apply(has_ai).astype(int)
-    df["svc_iot"]=df["services_offered"].apply(has_iot).astype(int)
-    df["svc_mobile"]=df["services_offered"].apply(has_mobile).astype(int)
-    df.to_csv("outputs/clean_raw.csv",index=False)
-    to_xml(df,"outputs/clean_raw.xml")
-
+def summarize(df):
+    # the clean_raw_meta.json aggregates, worked out in pandas
     cols_base=["company_name","source","rating","reviews_count","hourly_rate","min_project_size","team_size","locations","services_offered"]
     null_counts={c:int(df[c].isna().sum()) for c in cols_base if c in df.columns}
     completeness={c:float((df[c].notna() & (df[c].astype(str)!="")).mean()) for c in cols_base if c in df.columns}
@@ -163,8 +90,7 @@ def main():
     num_fields=["rating","reviews_count","hourly_low","hourly_high","hourly_mid","min_project_usd","team_low","team_high","team_mid"]
     stats={k:numeric_stats(df[k]) for k in num_fields if k in df.columns}
     outliers={k:iqr_outliers_count(df[k]) for k in ["rating","reviews_count","hourly_mid","team_mid","min_project_usd"] if k in df.columns}
-    meta={
-        "timestamp": datetime.utcnow().isoformat(),
+    return {
         "rows_total": int(len(df)),
         "unique_companies": uniq_companies,
         "possible_duplicates": dups,
@@ -173,11 +99,72 @@ def main():
         "completeness": completeness,
         "numeric_stats": stats,
         "outliers_1_5_IQR": outliers,
-        "columns": list(df.columns)
+    }
+
+def prepare(df,run):
+    df["company_name"]=df["company_name"].astype(str).str.strip()
+    df=df[df["company_name"].notna() & (df["company_name"]!="")]
+    df["rating"]=pd.to_numeric(df["rating"],errors="coerce")
+    df["reviews_count"]=pd.to_numeric(df["reviews_count"],errors="coerce").fillna(0).astype(int)
+    # next to updated_at, ahead of the generated columns --sql reads, so both paths order columns alike
+    df.insert(df.columns.get_loc("updated_at")+1,"clean_run",run)
+    return tidy(derive(df))
+
+def main(args=None):
+    # clean_data [--full] [--sql]; without --full only rows updated since the last run are fetched and cleaned,
+    # with --sql the ranges come from the generated columns and the meta aggregates are computed by Postgres.
+    # Returns the cleaned frame when it changed
+    ensure_dirs()
+    args=sys.argv[1:] if args is None else args
+    full="--full" in args
+    sql="--sql" in args
+    state=read_state("clean")
+    old=None
+    if not full and state.get("version")==VERSION and os.path.exists("outputs/clean_raw.parquet"):
+        old=load("outputs/clean_raw")
+    run=state.get("run",0)+1
+    if old is None:
+        raw=fetch(parsed=sql)
+        if raw.empty:
+            print("no data"); return
+        df=prepare(raw,run)
+    else:
+        # updated_at is the transaction start, so a row can commit after a later-stamped one was read:
+        # each run re-reads an overlap window and skips the rows it already has at that version
+        raw=fetch(pd.Timestamp(state["watermark"])-pd.Timedelta(seconds=OVERLAP),sql)
+        if not raw.empty:
+            raw=raw[~pd.MultiIndex.from_frame(raw[["id","updated_at"]]).isin(pd.MultiIndex.from_frame(old[["id","updated_at"]]))]
+        gone=old["id"].isin(raw["id"]) | ~old["id"].isin(fetch_ids())
+        if raw.empty and not gone.any():
+            print("ok (no changes)"); return
+        new=prepare(raw,run) if not raw.empty else raw
+        df=tidy(pd.concat([old[~gone]]+([new] if len(new) else []),ignore_index=True))
+        print(f"clean: {len(raw)} new or changed rows, {int(gone.sum())} replaced or removed")
+    df=df.sort_values("id",kind="stable").reset_index(drop=True)
+    marks=[pd.Timestamp(state["watermark"])] if old is not None else []
+    if not raw.empty:
+        marks.append(raw["updated_at"].max())
+    with ThreadPoolExecutor(1) as pool:
+        # Postgres works out the meta while the exports are written
+        pending=pool.submit(clean_meta,df,dbp()) if sql else None
+        typed=save(df,"outputs/clean_raw")
+        to_csv(df,"outputs/clean_raw.csv")
+        to_xml(df,"outputs/clean_raw.xml")
+        agg=pending.result() if pending else None
+    if sql and agg is None:
+        print("clean: market_entries changed since it was read, meta computed in pandas")
+    if agg is None:
+        agg=summarize(df)
+    meta={
+        "timestamp": datetime.utcnow().isoformat(),
+        **agg,
+        "columns": [c for c in df.columns if c not in BOOKKEEPING]
     }
     with open("outputs/clean_raw_meta.json","w",encoding="utf-8") as f:
         json.dump(meta,f,ensure_ascii=False,indent=2)
+    write_state("clean",version=VERSION,run=run,watermark=str(max(marks)))
     print("ok")
+    return typed
 
 if __name__=="__main__":
     main()
@@ -0,0 +1,132 @@
+import sys
+import time
+import argparse
+import importlib
+from functools import partial
+
+# python -m src.scripts <command> (see __main__.py): one entry point for the pipeline stages. A stage's
+# module, and with it pandas, pyarrow or scrapy, is imported only when its command runs; "all" runs the
+# stages as a DAG (src.scripts.dag): clean, merge and analyze in this process, handing each stage's frame
+# to the next instead of reading it back from outputs/, the spiders and export in processes of their own,
+# and every stage whose inputs did not change since the last run skipped.
+
+STAGES = {
+    "scrape": "scrapy.crawler",
+    "clean": "src.scripts.clean_data",
+    "merge": "src.scripts.merge_tables",
+    "analyze": "src.scripts.analyze_data",
+    "export": "src.scripts.export_data",
+}
+EXPORTS = ["outputs/market_data.json", "outputs/market_data.xml", "outputs/market_data.csv"]
+
+def stage(name):
+    return importlib.import_module(STAGES[name])
+
+def flags(args):
+    return [f for f, on in [("--full", args.full), ("--sql", args.sql)] if on]
+
+def crawl(*spiders):
+    # every spider (all of them by default) at once on one reactor. Each crawler keeps its own downloader,
+    # so delays, concurrency and the adaptive throttle stay per site; they share one database engine
+    importlib.import_module("src.scripts.wait_for_postgres").main()
+    crawler = stage("scrape")
+    from scrapy.utils.project import get_project_settings
+    process = crawler.CrawlerProcess(get_project_settings())
+    crawlers = [process.create_crawler(name) for name in spiders or sorted(process.spider_loader.list())]
+    for c in crawlers:
+        process.crawl(c)
+    started = time.perf_counter()
+    process.start()
+    failed = throughput(crawlers, time.perf_counter() - started)
+    if failed:
+        raise RuntimeError(f"spiders did not finish: {', '.join(failed)}")
+
+def throughput(crawlers, wall):
+    print(f"{'spider':12s} {'finish':10s} {'pages':>7s} {'items':>7s} {'db rows':>8s} {'seconds':>8s} {'items/min':>10s}")
+    total = {"pages": 0, "items": 0, "rows": 0}
+    failed = []
+    for c in crawlers:
+        st = c.stats.get_stats()
+        reason = st.get("finish_reason", "not run")
+        seconds = st.get("elapsed_time_seconds") or 0
+        row = {"pages": st.get("response_received_count", 0), "items": st.get("item_scraped_count", 0), "rows": st.get("db/rows_written", 0)}
+        for k in total: total[k] += row[k]
+        if reason != "finished": failed.append(c.spidercls.name)
+        rate = row["items"] / seconds * 60 if seconds else 0
+        print(f"{c.spidercls.name:12s} {reason:10s} {row['pages']:7d} {row['items']:7d} {row['rows']:8d} {seconds:8.1f} {rate:10.1f}")
+    rate = total["items"] / wall * 60 if wall else 0
+    print(f"{'all':12s} {'':10s} {total['pages']:7d} {total['items']:7d} {total['rows']:8d} {wall:8.1f} {rate:10.1f}")
+    return failed
+
+def scrape(args):
+    crawl(*args.spiders)
+
+def clean(args):
+    return stage("clean").main(flags(args))
+
+def merge(args, df=None):
+    return stage("merge").main(flags(args), df)
+
+def analyze(args, df=None):
+    return stage("analyze").main(df)
+
+def export_files(paths):
+    return stage("export").main(paths)
+
+def export(args):
+    return export_files(args.paths or EXPORTS)
+
+def pipeline(args):
+    from src.scripts.dag import Stage, files, table
+    from src.scripts.features import VERSION
+    db = table("market_entries", stage("clean").dbp())
+    key = f"{VERSION}:{flags(args)}"
+    spiders = [] if args.no_scrape else [Stage("scrape", crawl, process=True, cache=False)]
+    crawled = [s.name for s in spiders]
+    return spiders + [
+        Stage("clean", lambda up: clean(args), deps=crawled, inputs=[db], key=key,
+              outputs=["outputs/clean_raw.parquet", "outputs/clean_raw.csv", "outputs/clean_raw.xml", "outputs/clean_raw_meta.json"]),
+        Stage("merge", lambda up: merge(args, up["clean"]), deps=["clean"], inputs=[files("outputs/clean_raw.parquet")], key=key,
+              outputs=["outputs/merged.parquet", "outputs/merged.csv", "outputs/merged.xml", "outputs/CHANGELOG.json"]),
+        Stage("analyze", lambda up: analyze(args, up["merge"]), deps=["merge"], inputs=[files("outputs/merged.parquet")],
+              outputs=["outputs/plots"]),
+        Stage("export", partial(export_files, EXPORTS), deps=crawled, inputs=[db], outputs=EXPORTS, process=True),
+    ]
+
+def run_all(args):
+    from src.scripts.dag import run
+    timings = run(pipeline(args), force=args.force)
+    print("  ".join(f"{k}={'skipped' if v is None else f'{v:.2f}s'}" for k, v in timings.items()))
+
+def parser():
+    p = argparse.ArgumentParser(prog="python -m src.scripts")
+    sub = p.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("scrape", help="crawl the spiders, all of them at once by default")
+    s.add_argument("spiders", nargs="*")
+    s.set_defaults(run=scrape)
+    def stage_parser(name, fn, what):
+        s = sub.add_parser(name, help=what)
+        s.add_argument("--full", action="store_true", help="rebuild from the whole table instead of the last watermark")
+        s.add_argument("--sql", action="store_true", help="read parsed ranges from the generated columns and compute the aggregates in Postgres")
+        s.set_defaults(run=fn)
+        return s
+    stage_parser("clean", clean, "market_entries -> outputs/clean_raw.*")
+    stage_parser("merge", merge, "clean_raw -> outputs/merged.*")
+    s = sub.add_parser("analyze", help="merged -> outputs/plots")
+    s.set_defaults(run=analyze)
+    s = sub.add_parser("export", help="market_entries -> JSON, XML and CSV")
+    s.add_argument("paths", nargs="*", metavar="json xml csv")
+    s.set_defaults(run=export)
+    s = stage_parser("all", run_all, "scrape, then clean, merge and analyze next to export, skipping what is up to date")
+    s.add_argument("--no-scrape", action="store_true", help="start from what is already in market_entries")
+    s.add_argument("--force", action="store_true", help="run every stage even when its inputs did not change")
+    return p
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    if args.command == "export" and args.paths and len(args.paths) != 3:
+        sys.exit("export takes three paths: json xml csv")
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import hashlib
+from multiprocessing import get_context
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+# A small DAG executor for the pipeline stages. A stage runs once the stages it depends on are done,
+# next to every other stage that is ready: in a thread of this process when it takes its upstream
+# results (frames handed from one stage to the next), in a separate process otherwise (spiders,
+# export). A cached stage is skipped when the fingerprint of its inputs (a table's row count and
+# latest update, the content of files) matches the last run's and its outputs are all still there.
+
+STATE = os.path.join("outputs", ".state", "dag.json")
+
+class Stage:
+    def __init__(self, name, fn, deps=(), inputs=(), outputs=(), process=False, cache=True, key=""):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.process = process
+        self.cache = cache
+        # anything besides the inputs that changes what the stage writes (its flags)
+        self.key = key
+
+def table(name, params):
+    def fingerprint():
+        import psycopg2
+        with psycopg2.connect(**params) as c:
+            with c.cursor() as cur:
+                cur.execute(f"SELECT count(*), max(updated_at) FROM {name}")
+                return f"{name}:{cur.fetchone()}"
+    return fingerprint
+
+def files(*paths):
+    def fingerprint():
+        h = hashlib.sha1()
+        for path in paths:
+            h.update(path.encode())
+            if not os.path.exists(path):
+                h.update(b"missing")
+                continue
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+        return h.hexdigest()
+    return fingerprint
+
+def fingerprint(stage):
+    h = hashlib.sha1(f"{stage.name}:{stage.key}".encode())
+    for inp in stage.inputs:
+        h.update(inp().encode())
+    return h.hexdigest()
+
+def read_state():
+    try:
+        with open(STATE, encoding="utf-8") as f: return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_state(state):
+    os.makedirs(os.path.dirname(STATE), exist_ok=True)
+    with open(STATE + ".tmp", "w", encoding="utf-8") as f: json.dump(state, f, indent=2)
+    os.replace(STATE + ".tmp", STATE)
+
+def run(stages, force=False, workers=None):
+    # returns {stage: seconds, or None when skipped}
+    by_name = {s.name: s for s in stages}
+    state = read_state()
+    results, timings, running, started = {}, {}, {}, {}
+    threads = ThreadPoolExecutor(len(stages))
+    processes = ProcessPoolExecutor(workers or len(stages), mp_context=get_context("spawn"))
+    try:
+        while len(timings) < len(stages):
+            ready = [s for s in stages if s.name not in timings and s.name not in running
+                     and all(d in timings for d in s.deps)]
+            for s in ready:
+                key = fingerprint(s) if s.cache else None
+                if key and not force and state.get(s.name) == key and all(os.path.exists(p) for p in s.outputs):
+                    timings[s.name] = None
+                    results[s.name] = None
+                    print(f"[{s.name}] skipped, inputs unchanged")
+                    continue
+                print(f"[{s.name}] started")
+                started[s.name] = (time.perf_counter(), key)
+                if s.process:
+                    running[s.name] = processes.submit(s.fn)
+                else:
+                    running[s.name] = threads.submit(s.fn, {d: results[d] for d in s.deps})
+            if not running:
+                if not ready:
+                    raise ValueError(f"stages waiting on missing dependencies: {sorted(set(by_name) - set(timings))}")
+                continue
+            finished, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name in [n for n, f in running.items() if f in finished]:
+                results[name] = running.pop(name).result()
+                began, key = started[name]
+                timings[name] = time.perf_counter() - began
+                if key:
+                    state[name] = key
+                    write_state(state)
+                print(f"[{name}] done in {timings[name]:.2f}s")
+    finally:
+        threads.shutdown(cancel_futures=True)
+        processes.shutdown(cancel_futures=True)
+    return {s.name: timings[s.name] for s in stages}
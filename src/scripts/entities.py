@@ -0,0 +1,279 @@
+import re, unicodedata, pandas as pd, numpy as np
+from collections import defaultdict
+
+# legal-form words dropped from the end of a name, so "Acme Inc." and "ACME" share a key
+LEGAL={"inc","incorporated","llc","ltd","limited","corp","corporation","co","company","gmbh","ag","sa","srl","bv",
+       "plc","pvt","pte","oy","ab","as","sro","sp","z","o","oo","lp","llp","tov","ooo","group"}
+# hosts that say nothing about which company a row is
+SHARED_HOSTS={"clutch.co","goodfirms.co","linkedin.com","facebook.com","instagram.com","twitter.com","x.com",
+              "google.com","sites.google.com","youtube.com","github.com","medium.com","behance.net","dribbble.com"}
+# a domain claimed by more distinct names than this is a shared host too
+DOMAIN_MAX_NAMES=5
+# token blocks bigger than this ("software", "digital", ...) are too common to say anything
+BLOCK_MAX=100
+WINDOW=4
+FUZZY=0.85
+
+def name_key(s):
+    if s is None or (isinstance(s,float) and np.isnan(s)): return ""
+    s=str(s)
+    if not s.isascii():
+        s="".join(c for c in unicodedata.normalize("NFKD",s) if not unicodedata.combining(c))
+    s=s.casefold()
+    tokens=re.findall(r"\w+",s.replace("&"," and ").replace("_"," "))
+    core=list(tokens)
+    while core and core[-1] in LEGAL: core.pop()
+    if core and core[0]=="the": core=core[1:]
+    return " ".join(core or tokens)
+
+rx_host=re.compile(r"^\s*(?:[a-zA-Z][\w+.-]*:)?//(?:[^@/?#]*@)?(?:www\.)?([^/?#:\s]*)",re.I)
+
+def hosts(col):
+    # the hostname urlparse would give, lowercased and without "www.", for each distinct url
+    codes,uniques=pd.factorize(col,use_na_sentinel=False)
+    h=pd.Series(uniques,dtype=object).where(pd.notna(uniques),"").astype("string[pyarrow]").str.extract(rx_host)[0]
+    return h.fillna("").str.lower().to_numpy(dtype=object)[codes]
+
+def _each(fn,col):
+    # names and urls repeat across sources: run fn once per distinct value
+    codes,uniques=pd.factorize(col,use_na_sentinel=False)
+    return np.array([fn(v) for v in uniques],dtype=object)[codes]
+
+def domains(df):
+    # the company's own site: website_url, else a profile_url that is not on the listing's host
+    blank=np.full(len(df),"",dtype=object)
+    site=hosts(df["website_url"]) if "website_url" in df else blank
+    at=np.flatnonzero(site=="")
+    if "profile_url" in df and len(at):
+        prof=hosts(df["profile_url"].iloc[at])
+        listing=hosts(df["source_url"].iloc[at]) if "source_url" in df else blank[at]
+        site[at]=np.where(prof!=listing,prof,"")
+    site=pd.Series(site,index=df.index,dtype=object)
+    return site.where(~site.isin(SHARED_HOSTS),"")
+
+def trigrams(key):
+    s=f"  {key.replace(' ','')} "
+    return {s[i:i+3] for i in range(len(s)-2)}
+
+def similarity(a,b):
+    return len(a&b)/len(a|b) if a and b else 0.0
+
+class Clusters:
+    def __init__(self,n,parent=None):
+        self.parent=list(range(n)) if parent is None else parent
+
+    def find(self,i):
+        p=self.parent
+        while p[i]!=i:
+            p[i]=p[p[i]]
+            i=p[i]
+        return i
+
+    def union(self,a,b):
+        # the root that was attached to the other one, None when a and b were already together
+        a,b=self.find(a),self.find(b)
+        if a==b: return None
+        if b<a: a,b=b,a
+        self.parent[b]=a
+        return b
+
+def member(values,of):
+    return pd.Series(values,dtype=object).isin(of).to_numpy()
+
+def tokens(key):
+    return {t for t in key.split() if len(t)>=3 and not t.isdigit()}
+
+def shared_domains(keys,doms):
+    # domains claimed by more than DOMAIN_MAX_NAMES distinct names
+    kd=pd.DataFrame({"key":keys,"domain":doms})
+    per=kd[kd["domain"]!=""].drop_duplicates()["domain"].value_counts()
+    return set(per.index[per>DOMAIN_MAX_NAMES])
+
+def name_domains(keys,doms):
+    # per name the one domain its rows agree on, "" when they have none and None when they disagree
+    out=dict.fromkeys(keys,"")
+    for k,d in zip(keys,doms):
+        if d and out[k]!=d:
+            out[k]=d if out[k]=="" else None
+    return out
+
+def sorted_names(kdom):
+    # names taking part in fuzzy matching, in sorted-neighbourhood order
+    return sorted((k for k,d in kdom.items() if k and d is not None),key=lambda k:(k.replace(" ",""),k))
+
+def near(compact,ks):
+    # names less than WINDOW places away from ks in sorted-name order
+    at={k:i for i,k in enumerate(compact)}
+    out=set()
+    for k in ks:
+        i=at.get(k)
+        if i is not None: out.update(compact[max(0,i-WINDOW+1):i+WINDOW])
+    return out
+
+def stale(prev,gone,keys,doms,new,shared,kdom,blocks,compact):
+    # previous clusters that may have lost a link: they hold a row that changed or went away, share a
+    # name or domain with one, or hold a name whose fuzzy candidates changed (a block crossed BLOCK_MAX
+    # or a changed name sat or now sits next to it)
+    pkeys=prev["key"].to_numpy(dtype=object)
+    pdoms=prev["domain"].to_numpy(dtype=object)
+    was=shared_domains(pkeys,pdoms)
+    flipped=shared^was
+    changed=set(keys[new])|set(pkeys[gone])
+    if flipped:
+        changed|=set(keys[member(doms,flipped)])|set(pkeys[member(pdoms,flipped)])
+    sites=(set(doms[new])|set(pdoms[gone])|flipped)-(shared&was)-{""}
+    kwas=name_domains(pkeys,np.where(member(pdoms,was),"",pdoms))
+    dirty=set(changed)
+    delta=defaultdict(int)
+    for k in changed:
+        for t in tokens(k):
+            delta[t]+=(kwas.get(k) is not None)-(kdom.get(k) is not None)
+    for t,d in delta.items():
+        now=len(blocks.get(t,()))
+        if (now>BLOCK_MAX)!=(now+d>BLOCK_MAX): dirty.update(blocks.get(t,()))
+    dirty|=near(compact,changed)|near(sorted_names(kwas),changed)
+    hit=gone|member(pkeys,dirty)|member(pdoms,sites)
+    return set(prev["cluster_id"].to_numpy()[hit].tolist())
+
+def resolve(df,prev=None,fresh=None):
+    # cluster_id per row (the smallest id in its cluster) and an audit of why rows were merged.
+    # Rows link on the same company domain, on the same normalized name unless their domains
+    # disagree, and on near-identical names (character trigram Jaccard >= FUZZY) among the
+    # candidates that share a rare name token or sit next to each other in sorted-name order.
+    # prev is the last run's id, cluster_id, key, domain and link per row and fresh marks the rows
+    # changed since: clusters none of whose links can have changed are kept as they were, and only
+    # the rows of the others and the new ones are linked again. Returns cluster_id, key, domain and
+    # link (the rule that attached the row to its cluster, "" for one row per cluster) per row.
+    n=len(df)
+    ids=df["id"].to_numpy()
+    if prev is None:
+        new=np.ones(n,dtype=bool)
+        keys=_each(name_key,df["company_name"])
+        doms=domains(df).to_numpy(dtype=object)
+    else:
+        at=pd.Index(prev["id"]).get_indexer(ids)
+        new=(at<0)|np.asarray(fresh,dtype=bool)
+        keys=prev["key"].to_numpy(dtype=object)[at]
+        doms=prev["domain"].to_numpy(dtype=object)[at]
+        if new.any():
+            keys[new]=_each(name_key,df["company_name"][new])
+            doms[new]=domains(df[new]).to_numpy(dtype=object)
+    shared=shared_domains(keys,doms)
+    site=np.where(member(doms,shared),"",doms)
+    kdom=name_domains(keys,site)
+    compact=sorted_names(kdom)
+    toks={k:tokens(k) for k in compact}
+    blocks=defaultdict(list)
+    for k in compact:
+        for t in toks[k]: blocks[t].append(k)
+
+    via=np.full(n,"",dtype=object)
+    parent=None
+    loose=new
+    if prev is not None:
+        gone=np.ones(len(prev),dtype=bool)
+        gone[at[~new]]=False
+        was=prev["cluster_id"].to_numpy()[at]
+        loose=new|member(was,stale(prev,gone,keys,doms,new,shared,kdom,blocks,compact))
+        kept=np.flatnonzero(~loose)
+        via[kept]=prev["link"].to_numpy(dtype=object)[at[kept]]
+        roots=kept[via[kept]==""]
+        parent=np.arange(n)
+        parent[kept]=pd.Series(roots,index=was[roots]).loc[was[kept]].to_numpy()
+        parent=parent.tolist()
+    c=Clusters(n,parent)
+
+    def link(a,b,rule):
+        r=c.union(a,b)
+        if r is not None: via[r]=rule
+
+    names=set(keys[loose])-{""}
+    by_domain=defaultdict(list)
+    for i in np.flatnonzero(member(site,set(site[loose])-{""})).tolist():
+        by_domain[site[i]].append(i)
+    for rows in by_domain.values():
+        for i in rows[1:]: link(rows[0],i,"domain")
+    by_key=defaultdict(list)
+    for i in np.flatnonzero(member(keys,names)).tolist():
+        by_key[keys[i]].append(i)
+    for k,rows in by_key.items():
+        if kdom[k] is None:
+            # same name on different sites: separate firms; rows without a site stay with each other
+            rows=[i for i in rows if not site[i]]
+        for i in rows[1:]: link(rows[0],i,"name")
+
+    # fuzzy pass over distinct names whose rows agree on at most one domain, for pairs with a name
+    # that was linked again
+    mine={k for k in names if kdom[k] is not None}
+    pairs=set()
+    for t in {t for k in mine for t in toks[k]}:
+        ks=blocks[t]
+        if len(ks)>BLOCK_MAX: continue
+        for x in range(len(ks)):
+            for y in range(x+1,len(ks)):
+                if ks[x] in mine or ks[y] in mine:
+                    pairs.add((ks[x],ks[y]) if ks[x]<ks[y] else (ks[y],ks[x]))
+    place={k:i for i,k in enumerate(compact)}
+    for x in sorted(place[k] for k in mine):
+        for y in range(max(0,x-WINDOW+1),min(x+WINDOW,len(compact))):
+            if y>x or (y<x and compact[y] not in mine):
+                a,b=compact[x],compact[y]
+                pairs.add((a,b) if a<b else (b,a))
+    first={}
+    for i,k in enumerate(keys.tolist()): first.setdefault(k,i)
+    grams={}
+    # numbers are part of the name: "Studio 3" is not "Studio 4"
+    digits={k:[t for t in k.split() if t.isdigit()] for k in compact}
+    scored=0
+    for a,b in pairs:
+        da,db=kdom[a],kdom[b]
+        if (da and db and da!=db) or digits[a]!=digits[b]: continue
+        if c.find(first[a])==c.find(first[b]): continue
+        ga=grams.get(a) or grams.setdefault(a,trigrams(a))
+        gb=grams.get(b) or grams.setdefault(b,trigrams(b))
+        scored+=1
+        if similarity(ga,gb)>=FUZZY:
+            link(first[a],first[b],"fuzzy")
+
+    roots=np.fromiter((c.find(i) for i in range(n)),dtype=np.int64,count=n)
+    cluster=pd.Series(ids,index=df.index).groupby(roots).transform("min")
+    counts=pd.Series(via[via!=""]).value_counts()
+    merged=pd.DataFrame({"cluster_id":cluster.to_numpy(),"rule":pd.Series(via,dtype=object)})
+    merged=merged[merged["rule"]!=""].drop_duplicates()
+    rules=defaultdict(set)
+    for cid,rule in zip(merged["cluster_id"].tolist(),merged["rule"].tolist()):
+        rules[cid].add(rule)
+    audit={
+        "records": n,
+        "clusters": int(cluster.nunique()),
+        "records_merged": int(n-cluster.nunique()),
+        "records_relinked": int(loose.sum()),
+        "links": {r:int(counts.get(r,0)) for r in ("domain","name","fuzzy")},
+        "shared_domains_ignored": len(shared),
+        "blocking": {"token_blocks": len(blocks), "oversized_blocks_skipped": sum(len(ks)>BLOCK_MAX for ks in blocks.values()),
+                     "candidate_pairs": len(pairs), "pairs_scored": scored},
+        "_rules": rules,
+    }
+    return pd.DataFrame({"cluster_id":cluster,"key":keys,"domain":doms,"link":via},index=df.index),audit
+
+def audit_samples(df,audit,limit=50):
+    # the biggest multi-record clusters, with the names, sources and domains they merged
+    rules=audit.pop("_rules")
+    sizes=df["cluster_id"].value_counts()
+    multi=sizes[sizes>1]
+    audit["multi_record_clusters"]=int(len(multi))
+    sources=df.groupby("cluster_id")["source"].nunique()
+    audit["cross_source_clusters"]=int((sources[multi.index]>1).sum()) if len(multi) else 0
+    samples=[]
+    for cid in multi.sort_values(ascending=False,kind="stable").head(limit).index:
+        rows=df[df["cluster_id"]==cid]
+        samples.append({
+            "cluster_id": int(cid),
+            "size": int(len(rows)),
+            "names": sorted(set(rows["company_name"].astype(str))),
+            "sources": sorted(set(rows["source"].dropna().astype(str))),
+            "domains": sorted(set(d for d in domains(rows) if d)),
+            "rules": sorted(rules.get(int(cid),())),
+        })
+    audit["samples"]=samples
+    return audit
@@ -4,6 +4,27 @@ import sys
 import os
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from src.scripts.xml_stream import XmlStream, open_xml
+
+QUERY = """
+    SELECT
+      id,
+      source_url,
+      profile_url,
+      website_url,
+      company_name,
+      rating,
+      reviews_count,
+      hourly_rate,
+      min_project_size,
+      team_size,
+      locations,
+      services_offered,
+      case_studies_count,
+      last_crawled_at
+    FROM market_entries
+    ORDER BY id ASC
+"""
 
 def db_url():
     user = os.getenv("POSTGRES_USER", "market")
@@ -13,76 +34,106 @@ def db_url():
     db = os.getenv("POSTGRES_DB", "marketdb")
     return f"dbname={db} user={user} password={password} host={host} port={port}"
 
-def fetch_rows():
+def stream_rows(itersize=None):
+    # server-side cursor: rows arrive itersize at a time instead of the whole table at once
     conn = psycopg2.connect(db_url())
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT
-                  id,
-                  source_url,
-                  profile_url,
-                  website_url,
-                  company_name,
-                  rating,
-                  reviews_count,
-                  hourly_rate,
-                  min_project_size,
-                  team_size,
-                  locations,
-                  services_offered,
-                  case_studies_count,
-                  last_crawled_at
-                FROM market_entries
-                ORDER BY id ASC
-            """)
-            return cur.fetchall()
+        with conn.cursor(name="export_market_entries", cursor_factory=RealDictCursor) as cur:
+            cur.itersize = itersize or int(os.getenv("EXPORT_ITERSIZE", "2000"))
+            cur.execute(QUERY)
+            yield from cur
     finally:
         conn.close()
 
+def fetch_rows():
+    return list(stream_rows())
+
+def as_text(v):
+    return json.dumps(v, ensure_ascii=False) if isinstance(v, (list, dict)) else v
+
+class JsonWriter:
+    # a .jsonl path gets one object per line; anything else the indented array json.dump wrote
+    def __init__(self, f, lines=False):
+        self.f = f
+        self.lines = lines
+        self.n = 0
+
+    def write(self, r):
+        if self.lines:
+            self.f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+            return
+        body = json.dumps(r, ensure_ascii=False, indent=2, default=str).replace("\n", "\n  ")
+        self.f.write(("[\n  " if self.n == 0 else ",\n  ") + body)
+        self.n += 1
+
+    def close(self):
+        if not self.lines:
+            self.f.write("\n]" if self.n else "[]")
+
+class XmlWriter:
+    def __init__(self, f):
+        self.x = XmlStream(f, "market", "entry", pretty=True, declaration=False)
+
+    def write(self, r):
+        self.x.write((k, "" if v is None else as_text(v), None) for k, v in r.items())
+
+    def close(self):
+        self.x.close()
+
+class CsvWriter:
+    def __init__(self, f):
+        self.f = f
+        self.w = None
+
+    def write(self, r):
+        if self.w is None:
+            # header from the first row; an empty table leaves an empty file
+            self.w = csv.DictWriter(self.f, fieldnames=list(r.keys()))
+            self.w.writeheader()
+        self.w.writerow({k: as_text(v) for k, v in r.items()})
+
+    def close(self):
+        pass
+
+def open_writer(kind, path):
+    if kind == "csv":
+        f = open(path, "w", newline="", encoding="utf-8")
+        return f, CsvWriter(f)
+    if kind == "xml":
+        f = open_xml(path)
+        return f, XmlWriter(f)
+    f = open(path, "w", encoding="utf-8")
+    return f, JsonWriter(f, lines=path.endswith(".jsonl"))
+
+def export(rows, targets):
+    # one pass over rows, fanned out to every (kind, path) target
+    opened = [open_writer(kind, path) for kind, path in targets]
+    try:
+        n = 0
+        for r in rows:
+            for _, w in opened:
+                w.write(r)
+            n += 1
+        for _, w in opened:
+            w.close()
+        return n
+    finally:
+        for f, _ in opened:
+            f.close()
+
 def write_json(path, rows):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(rows, f, ensure_ascii=False, indent=2, default=str)
+    export(rows, [("json", path)])
 
 def write_xml(path, rows):
-    from xml.sax.saxutils import escape
-    with open(path, "w", encoding="utf-8") as f:
-        f.write("<market>\n")
-        for r in rows:
-            f.write("  <entry>\n")
-            for k, v in r.items():
-                if isinstance(v, (list, dict)):
-                    v = json.dumps(v, ensure_ascii=False)
-                f.write(f"    <{k}>{escape(str(v) if v is not None else '')}</{k}>\n")
-            f.write("  </entry>\n")
-        f.write("</market>\n")
+    export(rows, [("xml", path)])
 
 def write_csv(path, rows):
-    if not rows:
-        with open(path, "w", newline="", encoding="utf-8") as f:
-            pass
-        return
-    keys = list(rows[0].keys())
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=keys)
-        w.writeheader()
-        for r in rows:
-            r2 = {}
-            for k, v in r.items():
-                if isinstance(v, (list, dict)):
-                    r2[k] = json.dumps(v, ensure_ascii=False)
-                else:
-                    r2[k] = v
-            w.writerow(r2)
-
-def main():
-    out_json = sys.argv[1]
-    out_xml = sys.argv[2]
-    out_csv = sys.argv[3]
-    rows = fetch_rows()
-    write_json(out_json, rows)
-    write_xml(out_xml, rows)
-    write_csv(out_csv, rows)
+    export(rows, [("csv", path)])
+
+def main(args=None):
+    out_json, out_xml, out_csv = sys.argv[1:4] if args is None else args
+    n = export(stream_rows(), [("json", out_json), ("xml", out_xml), ("csv", out_csv)])
+    print(f"exported {n} rows")
 
 if __name__ == "__main__":
     main()
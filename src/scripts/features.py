@@ -0,0 +1,263 @@
+import os, re, ast, json, glob, hashlib, pandas as pd, numpy as np
+from functools import lru_cache
+import pyarrow.parquet as pq
+from urllib.parse import urlparse
+
+# bump when a derivation below or the cleaned columns change, so caches and incremental state are rebuilt
+VERSION=3
+CACHE_DIR=os.path.join("outputs",".cache","features")
+CACHE_KEEP=4
+
+RAW=["source_url","hourly_rate","min_project_size","team_size","locations","services_offered"]
+LISTS=["locations","services_offered"]
+# service taxonomy: category -> regex alternatives matched as whole words, case-insensitive. Each
+# category becomes a 0/1 column svc_<category>; bump VERSION after editing so incremental state is rebuilt
+SERVICES={
+    "AI": r"ai|artificial intelligence|machine learning|ml|computer vision|nlp|natural language processing|deep learning",
+    "IoT": r"iot|internet of things",
+    "Mobile": r"mobile|android|ios|iphone|ipad|flutter|react native|mobile app",
+}
+SERVICE_COLUMNS=[f"svc_{k.lower()}" for k in SERVICES]
+DERIVED=["source","hourly_low","hourly_high","hourly_mid","min_project_usd","team_low","team_high","team_mid",
+         *SERVICE_COLUMNS,"region","min_project_bucket"]
+# raw string -> the columns parsed out of it, which market_entries also stores as generated columns
+PARSES={"source_url":["source"],"hourly_rate":["hourly_low","hourly_high","hourly_mid"],
+        "min_project_size":["min_project_usd"],"team_size":["team_low","team_high","team_mid"]}
+PARSED=[c for cs in PARSES.values() for c in cs]
+CATEGORIES=["source","region","min_project_bucket","price_segment"]
+INTS=["hourly_low","hourly_high","min_project_usd","team_low","team_high"]
+# kept in the parquet handoff for incremental runs, left out of the CSV exports
+BOOKKEEPING=["updated_at","clean_run"]
+STATE_DIR=os.path.join("outputs",".state")
+
+def domain(u):
+    try: return urlparse(u).netloc.lower()
+    except: return None
+
+rx_money_span = re.compile(r"\$?\s?(\d[\d,]*)\s*-\s*\$?\s?(\d[\d,]*)")
+rx_money_below = re.compile(r"<\s*\$?\s?(\d[\d,]*)")
+rx_money_plus = re.compile(r"\$?\s?(\d[\d,]*)\s*\+")
+rx_money = re.compile(r"\$?\s?(\d[\d,]*)")
+rx_team_span = re.compile(r"(\d+)\s*-\s*(\d+)")
+rx_team = re.compile(r"(\d+)")
+
+def _texts(col):
+    return col.where(col.notna(),"").astype(str)
+
+def _num(digits):
+    return pd.to_numeric(digits.str.replace(",","",regex=False)).to_numpy(dtype=float)
+
+def _match(t,todo,rx):
+    # first match of rx in the rows no earlier pattern matched; marks them done
+    at=np.flatnonzero(todo)
+    m=t.iloc[at].str.extract(rx)
+    ok=m[0].notna().to_numpy()
+    todo[at[ok]]=False
+    return at[ok],m[ok]
+
+def _column(v,index):
+    s=pd.Series(v,index=index)
+    return s.astype("int64") if s.notna().all() else s
+
+def _spread(parse,col):
+    # range columns hold a few dozen distinct strings: parse those once, then take()
+    codes,uniques=pd.factorize(col,use_na_sentinel=False)
+    lo,hi=parse(_texts(pd.Series(uniques,dtype=object)))
+    return _column(lo[codes],col.index),_column(hi[codes],col.index)
+
+def _money(t):
+    lo=np.full(len(t),np.nan)
+    hi=np.full(len(t),np.nan)
+    todo=np.ones(len(t),dtype=bool)
+    at,m=_match(t,todo,rx_money_span)
+    lo[at]=_num(m[0]); hi[at]=_num(m[1])
+    at,m=_match(t,todo,rx_money_below)
+    lo[at]=0; hi[at]=_num(m[0])
+    for rx in (rx_money_plus,rx_money):
+        at,m=_match(t,todo,rx)
+        lo[at]=hi[at]=_num(m[0])
+    return lo,hi
+
+def _team(t):
+    # commas become spaces first, so "1,000 - 9,999" reads as (0, 9) like it always has
+    t=t.str.replace(","," ",regex=False)
+    lo=np.full(len(t),np.nan)
+    hi=np.full(len(t),np.nan)
+    todo=np.ones(len(t),dtype=bool)
+    at,m=_match(t,todo,rx_team_span)
+    lo[at]=_num(m[0]); hi[at]=_num(m[1])
+    at,m=_match(t,todo,rx_team)
+    lo[at]=hi[at]=_num(m[0])
+    return lo,hi
+
+def mranges(col):
+    # "$lo - $hi", "<$X" -> (0, X), "$X+" and a bare "$X" -> (X, X); anything else NaN
+    return _spread(_money,col)
+
+def tranges(col):
+    return _spread(_team,col)
+
+def norm_list(v):
+    # JSONB lists from the database, or their JSON / repr() text once written to CSV
+    if v is None or (isinstance(v,float) and np.isnan(v)): return []
+    if isinstance(v,(list,tuple,np.ndarray)): return [str(x).strip() for x in v if str(x).strip()]
+    s=str(v).strip()
+    for load in (json.loads,ast.literal_eval):
+        try: x=load(s)
+        except: continue
+        if isinstance(x,list): return [str(i).strip() for i in x if str(i).strip()]
+    return [s] if s else []
+
+def lists(col):
+    if all(type(v) is list for v in col):
+        # already normalized (parquet handoff)
+        return col
+    seen={}
+    def one(v):
+        if isinstance(v,(list,tuple,np.ndarray)): return norm_list(v)
+        if v not in seen: seen[v]=norm_list(v)
+        return list(seen[v])
+    return pd.Series([one(v) for v in col],index=col.index,dtype=object)
+
+def matchers(taxonomy):
+    # one pattern for the whole taxonomy. It stops only where a term of some category starts, and there
+    # a named lookahead per category records whether one of that category's terms starts too, so one scan
+    # labels every category, overlapping terms included ("machine learning" / "machine learning ops")
+    terms="|".join(f"(?:{p})" for p in taxonomy.values())
+    groups="".join(f"(?:(?=(?P<c{i}>(?:{p})\\b))|)" for i,p in enumerate(taxonomy.values()))
+    rx=re.compile(rf"\b(?=(?:{terms})\b){groups}",re.I)
+    return rx,tuple(rx.groupindex[f"c{i}"] for i in range(len(taxonomy)))
+
+rx_services=matchers(SERVICES)
+
+@lru_cache(maxsize=65536)
+def label(s,rx=rx_services):
+    pattern,groups=rx
+    hit=[False]*len(groups)
+    for m in pattern.finditer(s):
+        hit=[h or v is not None for h,v in zip(hit,m.group(0,*groups)[1:])]
+        if all(hit): break
+    return hit
+
+def services(col):
+    # multi-hot matrix of SERVICES per row: service names repeat across companies, so each distinct
+    # string is labelled once and rows OR their strings' labels
+    lengths=np.fromiter((len(v) for v in col),dtype=np.int64,count=len(col))
+    codes,uniques=pd.factorize(pd.Series([str(x) for v in col for x in v],dtype=object))
+    hits=np.array([label(s) for s in uniques],dtype=bool).reshape(len(uniques),len(SERVICES))[codes]
+    rows=np.repeat(np.arange(len(col)),lengths)
+    out=pd.DataFrame(index=col.index)
+    for j,c in enumerate(SERVICE_COLUMNS):
+        out[c]=(np.bincount(rows[hits[:,j]],minlength=len(col))>0).astype(int)
+    return out
+
+def region(lst):
+    # second part of the first location ("Kyiv, Ukraine" -> "Ukraine")
+    if not lst: return "Unknown"
+    parts=[p.strip() for p in str(lst[0]).split(",") if p.strip()]
+    if len(parts)>=2: return parts[1]
+    return parts[-1] if parts else "Unknown"
+
+def project_bucket(v):
+    if pd.isna(v): return "Unknown"
+    if v<5000: return "< $5k"
+    if v<10000: return "$5k–$10k"
+    if v<25000: return "$10k–$25k"
+    if v<50000: return "$25k–$50k"
+    if v<100000: return "$50k–$100k"
+    return "$100k+"
+
+def compute(df):
+    out=pd.DataFrame(index=df.index)
+    if "source_url" in df: out["source"]=df["source_url"].apply(domain)
+    for c in LISTS:
+        if c in df: out[c]=lists(df[c])
+    if "hourly_rate" in df:
+        out["hourly_low"],out["hourly_high"]=mranges(df["hourly_rate"])
+        out["hourly_mid"]=(out["hourly_low"]+out["hourly_high"])/2
+    if "min_project_size" in df:
+        out["min_project_usd"]=mranges(df["min_project_size"])[0]
+    if "team_size" in df:
+        out["team_low"],out["team_high"]=tranges(df["team_size"])
+        out["team_mid"]=(out["team_low"]+out["team_high"])/2
+    if "services_offered" in out:
+        flags=services(out["services_offered"])
+        for c in SERVICE_COLUMNS: out[c]=flags[c]
+    if "locations" in out: out["region"]=out["locations"].apply(region)
+    return out
+
+def content_hash(df):
+    cols=[c for c in RAW if c in df.columns]
+    h=hashlib.sha1(f"{VERSION}:{cols}:{SERVICES}".encode())
+    h.update(pd.util.hash_pandas_object(df[cols].astype(str),index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def _cached(df):
+    path=os.path.join(CACHE_DIR,content_hash(df)+".pkl")
+    if os.path.exists(path):
+        return pd.read_pickle(path)
+    out=compute(df)
+    os.makedirs(CACHE_DIR,exist_ok=True)
+    out.to_pickle(path+".tmp")
+    os.replace(path+".tmp",path)
+    for old in sorted(glob.glob(os.path.join(CACHE_DIR,"*.pkl")),key=os.path.getmtime)[:-CACHE_KEEP]:
+        os.remove(old)
+    return out
+
+def derive(df,keep=False):
+    # adds the columns parsed out of the raw market_entries strings, memoized on their content.
+    # Parsed columns the frame already carries (the generated ones, read with --sql) are not parsed
+    # again; keep=True is for frames read back from CSV: no column they already carry is replaced
+    todo=[c for c in DERIVED+LISTS if c not in df.columns or not (keep or c in PARSED)]
+    if not any(c in DERIVED for c in todo):
+        return df
+    raw=[c for c in RAW if c in df.columns and (c not in PARSES or any(p in todo for p in PARSES[c]))]
+    out=_cached(df[raw])
+    out.index=df.index
+    for c in out.columns:
+        if c in todo: df[c]=out[c]
+    if "min_project_bucket" in todo and "min_project_usd" in df:
+        df["min_project_bucket"]=df["min_project_usd"].apply(project_bucket)
+    return df
+
+def save(df,stem):
+    # stage handoff: typed parquet with real list columns; the CSV written next to it is only an export
+    out=df.copy(deep=False)
+    for c in CATEGORIES:
+        if c in out: out[c]=out[c].astype("category").cat.remove_unused_categories()
+    out.to_parquet(stem+".parquet",index=False)
+    # the typed frame, for the next stage when both run in one process
+    return out
+
+def load(stem):
+    path=stem+".parquet"
+    if not os.path.exists(path):
+        # outputs from before the parquet handoff; derive(keep=True) parses what it needs
+        return pd.read_csv(stem+".csv")
+    t=pq.read_table(path)
+    lists=[c for c in LISTS if c in t.column_names]
+    df=t.drop_columns(lists).to_pandas()
+    for c in lists:
+        df[c]=pd.Series([[] if v is None else v for v in t.column(c).to_pylist()],index=df.index,dtype=object)
+    return df[t.column_names]
+
+def tidy(df):
+    # rows cleaned in different runs concatenate to float64; a full run keeps int64 when nothing is missing
+    for c in INTS:
+        if c in df and df[c].notna().all(): df[c]=df[c].astype("int64")
+    return df
+
+def to_csv(df,path):
+    df.drop(columns=[c for c in BOOKKEEPING if c in df]).to_csv(path,index=False)
+
+def read_state(stage):
+    try:
+        with open(os.path.join(STATE_DIR,stage+".json"),encoding="utf-8") as f: return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_state(stage,**state):
+    os.makedirs(STATE_DIR,exist_ok=True)
+    path=os.path.join(STATE_DIR,stage+".json")
+    with open(path+".tmp","w",encoding="utf-8") as f: json.dump(state,f,indent=2,default=str)
+    os.replace(path+".tmp",path)
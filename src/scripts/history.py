@@ -0,0 +1,82 @@
+import sys, psycopg2, pandas as pd
+from contextlib import contextmanager
+from src.scripts.clean_data import dbp
+
+# Reads the change log the market_entries triggers keep (migration 0004). market_entries stays the
+# current state; market_entry_changes has one row per insert/update/delete with only what changed.
+#   python -m src.scripts.history company "Acme" [field ...]   how those fields moved for one company
+#   python -m src.scripts.history since 2026-10-01 [field ...]  every field that changed after a date
+
+FIELDS=["rating","hourly_rate"]
+
+COMPANY="""
+SELECT e.id AS entry_id, e.company_name, e.source, c.changed_at, c.op, f.key AS field, f.value
+FROM market_entries e
+JOIN market_entry_changes c ON c.entry_id = e.id
+CROSS JOIN LATERAL jsonb_each(c.changes) f
+WHERE (e.company_name = %(company)s OR e.natural_key = %(company)s OR e.id::text = %(company)s)
+  AND c.changes ?| %(fields)s AND f.key = ANY(%(fields)s)
+ORDER BY e.id, c.changed_at, f.key
+"""
+
+# the last value of each field up to the date against the latest one after it; partition pruning
+# keeps the scan to the months after since, the lookback goes through (entry_id, changed_at)
+SINCE="""
+WITH recent AS (
+    SELECT c.entry_id, c.changed_at, c.op, f.key AS field, f.value
+    FROM market_entry_changes c
+    LEFT JOIN LATERAL jsonb_each(c.changes) f ON true
+    WHERE c.changed_at > %(since)s AND (%(fields)s IS NULL OR f.key = ANY(%(fields)s) OR c.op = 'delete')
+), latest AS (
+    SELECT DISTINCT ON (entry_id, field) entry_id, field, op, value AS after, changed_at,
+           count(*) OVER (PARTITION BY entry_id, field) AS changes
+    FROM recent
+    ORDER BY entry_id, field, changed_at DESC
+)
+SELECT l.entry_id, e.company_name, l.field, l.op, b.value AS before, l.after, l.changes, l.changed_at
+FROM latest l
+LEFT JOIN market_entries e ON e.id = l.entry_id
+LEFT JOIN LATERAL (
+    SELECT c.changes -> l.field AS value
+    FROM market_entry_changes c
+    WHERE c.entry_id = l.entry_id AND c.changed_at <= %(since)s AND c.changes ? l.field
+    ORDER BY c.changed_at DESC
+    LIMIT 1
+) b ON true
+ORDER BY l.entry_id, l.field NULLS FIRST
+"""
+
+@contextmanager
+def cursor(params):
+    try:
+        with psycopg2.connect(**params) as c:
+            with c.cursor() as cur:
+                yield cur
+    except psycopg2.errors.UndefinedTable:
+        sys.exit("market_entry_changes is missing (migration 0004): run make migrate")
+
+def query(sql,args,params=None):
+    with cursor(params or dbp()) as cur:
+        cur.execute(sql,args)
+        cols=[d[0] for d in cur.description]
+        return pd.DataFrame(cur.fetchall(),columns=cols)
+
+def company_history(company,fields=FIELDS,params=None):
+    # one row per change of each field, for a company name, natural key or id
+    return query(COMPANY,{"company":str(company),"fields":list(fields)},params)
+
+def changed_since(since,fields=None,params=None):
+    # per entry and field changed after since: the value it had then, the value now and how many
+    # changes lie between; deleted entries come back once with field empty and op "delete"
+    return query(SINCE,{"since":since,"fields":list(fields) if fields else None},params)
+
+def main():
+    args=sys.argv[1:]
+    if len(args)<2 or args[0] not in ("company","since"):
+        sys.exit("usage: python -m src.scripts.history company NAME [field ...] | since DATE [field ...]")
+    what,key,fields=args[0],args[1],args[2:]
+    df=company_history(key,fields or FIELDS) if what=="company" else changed_since(key,fields)
+    df.to_csv(sys.stdout,index=False)
+
+if __name__ == "__main__":
+    main()
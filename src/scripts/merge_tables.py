@@ -1,27 +1,24 @@
-import os, json, pandas as pd, numpy as np
+import os, sys, json, pandas as pd, numpy as np
 import datetime
-from xml.etree.ElementTree import Element, SubElement, ElementTree
-import ast
+from src.scripts.clean_data import dbp
+from src.scripts.entities import audit_samples, resolve
+from src.scripts.features import STATE_DIR, VERSION, lists, load, read_state, save, to_csv, write_state
+from src.scripts.sql_stats import merge_aggregates
+from src.scripts.xml_stream import write_columns
+
+# per clean row its cluster, name key, domain and the rule that linked it, whether it won, and for the
+# winners the cluster's size and sources: the starting point of the next incremental merge
+CLUSTERS=os.path.join(STATE_DIR,"merge_clusters")
 
 def ensure_dirs():
     os.makedirs("outputs",exist_ok=True)
 
-def to_list(v):
-    if v is None or (isinstance(v,float) and np.isnan(v)): return []
-    if isinstance(v,list): return [str(x).strip() for x in v if str(x).strip()]
-    try:
-        x=ast.literal_eval(str(v))
-        if isinstance(x,list): return [str(i).strip() for i in x if str(i).strip()]
-    except: pass
-    s=str(v).strip()
-    return [s] if s else []
-
-def clip_iqr_stats(s):
+def clip_iqr_stats(s,quartiles=None):
     x=pd.to_numeric(s,errors="coerce")
     xx=x.dropna()
     if xx.empty:
         return x,{"q1":None,"q3":None,"iqr":None,"low":None,"high":None,"n_low":0,"n_high":0,"pct":0.0}
-    q1,q3=xx.quantile(0.25),xx.quantile(0.75)
+    q1,q3=quartiles or (xx.quantile(0.25),xx.quantile(0.75))
     iqr=q3-q1
     low,high=q1-1.5*iqr,q3+1.5*iqr
     n_low=int((xx<low).sum())
@@ -39,29 +36,50 @@ def seg(v):
     return "luxury"
 
 def to_xml(df,path):
-    r=Element("companies")
-    for _,row in df.iterrows():
-        c=SubElement(r,"company")
-        SubElement(c,"company_name").text=str(row.get("company_name",""))
-        SubElement(c,"source").text=str(row.get("source",""))
-        SubElement(c,"rating").text=str(row.get("rating",""))
-        SubElement(c,"reviews_count").text=str(row.get("reviews_count",""))
-        SubElement(c,"hourly_mid").text=str(row.get("hourly_mid",""))
-        SubElement(c,"min_project_usd").text=str(row.get("min_project_usd",""))
-        SubElement(c,"team_mid").text=str(row.get("team_mid",""))
-        SubElement(c,"price_segment").text=str(row.get("price_segment",""))
-        L=SubElement(c,"locations")
-        locs=row.get("locations")
-        locs=to_list(locs)
-        for loc in locs:
-            SubElement(L,"location").text=str(loc)
-        SubElement(c,"source_url").text=str(row.get("source_url",""))
-        SubElement(c,"last_crawled_at").text=str(row.get("last_crawled_at",""))
-    ElementTree(r).write(path,encoding="utf-8",xml_declaration=True)
-
-def main():
+    col=lambda c: df[c] if c in df else [""]*len(df)
+    locations=lists(df["locations"]) if "locations" in df else [[]]*len(df)
+    write_columns(path,"companies","company",[
+        ("company_name",col("company_name")),
+        ("source",col("source")),
+        ("rating",col("rating")),
+        ("reviews_count",col("reviews_count")),
+        ("hourly_mid",col("hourly_mid")),
+        ("min_project_usd",col("min_project_usd")),
+        ("team_mid",col("team_mid")),
+        ("price_segment",col("price_segment")),
+        ("locations",locations,"location"),
+        ("source_url",col("source_url")),
+        ("last_crawled_at",col("last_crawled_at")),
+    ],len(df))
+
+def winners(df):
+    # per resolved company the most reviewed row, then the best rated, then the oldest
+    df=df.sort_values(["cluster_id","reviews_count","rating","id"],ascending=[True,False,False,True],kind="stable")
+    return df.drop_duplicates(subset=["cluster_id"],keep="first")
+
+def affected(df,prev,fresh):
+    # clusters whose winner may differ from last run: they hold a new or changed row, gained or
+    # lost a member, or had one removed from the database
+    was=df["id"].map(prev.set_index("id")["cluster_id"])
+    moved=fresh | was.isna() | (was!=df["cluster_id"])
+    gone=~prev["id"].isin(df["id"])
+    broken=pd.Index(prev.loc[gone,"cluster_id"]).union(pd.Index(was[moved].dropna()))
+    return pd.Index(df.loc[moved | was.isin(broken),"cluster_id"]).unique()
+
+def cluster_columns(df,rows):
+    # size of each winner's cluster and the sources it was seen on
+    sizes=rows["cluster_id"].value_counts()
+    pairs=rows[["cluster_id","source"]].dropna().drop_duplicates().sort_values(["cluster_id","source"])
+    sources=pairs.assign(source=pairs["source"].astype(str)).groupby("cluster_id")["source"].agg(",".join)
+    df["cluster_size"]=df["cluster_id"].map(sizes).astype("int64")
+    df["cluster_sources"]=df["cluster_id"].map(sources).fillna("")
+
+def main(args=None,df=None):
+    # merge_tables [--full] [--sql]; without --full the previous winners are reused for unchanged companies,
+    # with --sql medians and quartiles are computed by Postgres. df is clean_data's frame when run after it
+    # in one process; returns the merged frame when it changed
     ensure_dirs()
-    df=pd.read_csv("outputs/clean_raw.csv")
+    df=load("outputs/clean_raw") if df is None else df
     if df.empty:
         print("no data"); return
 
@@ -71,10 +89,46 @@ def main():
     dup_map=df["company_name"].value_counts()
     dup_list={k:int(v) for k,v in dup_map[dup_map>1].sort_values(ascending=False).head(50).items()}
 
-    df=df.sort_values(["company_name","reviews_count","rating"],ascending=[True,False,False])
-    before=len(df)
-    df=df.drop_duplicates(subset=["company_name"],keep="first")
-    duplicates_removed=int(before-len(df))
+    args=sys.argv[1:] if args is None else args
+    full="--full" in args
+    sql="--sql" in args
+    state=read_state("merge")
+    last_run=int(df["clean_run"].max()) if "clean_run" in df else None
+    prev=None
+    if not full and last_run is not None and state.get("version")==VERSION and os.path.exists(CLUSTERS+".parquet"):
+        prev=pd.read_parquet(CLUSTERS+".parquet")
+        fresh=df["clean_run"]>state["clean_run"]
+        if not fresh.any() and len(prev)==len(df) and prev["id"].isin(df["id"]).all():
+            print("ok (no changes)"); return
+
+    res,er=resolve(df,prev,None if prev is None else fresh.to_numpy())
+    df["cluster_id"]=res["cluster_id"]
+    rows=df
+    if prev is None:
+        df=winners(df)
+        cluster_columns(df,rows)
+    else:
+        # only clusters that changed are linked again and can have a different winner, size or sources
+        todo=affected(df,prev,fresh)
+        touched=df["cluster_id"].isin(todo)
+        kept=df[df["id"].isin(prev.loc[prev["winner"],"id"]) & ~touched]
+        last=prev.set_index("id")
+        kept=kept.assign(cluster_size=kept["id"].map(last["cluster_size"]).astype("int64"),
+                         cluster_sources=kept["id"].map(last["cluster_sources"]))
+        won=winners(df[touched])
+        cluster_columns(won,rows[touched])
+        df=pd.concat([kept,won])
+        print(f"merge: {er['records_relinked']} of {er['records']} rows re-linked, {len(todo)} of {er['clusters']} companies re-deduplicated")
+    df=df.sort_values(["company_name","cluster_id"],kind="stable")
+    er=audit_samples(rows,er)
+    duplicates_removed=int(rows_in-len(df))
+    if last_run is not None:
+        os.makedirs(STATE_DIR,exist_ok=True)
+        won=df.set_index("id")
+        res=res.assign(id=rows["id"],winner=rows["id"].isin(df["id"]),
+                       cluster_size=rows["id"].map(won["cluster_size"]).astype("Int64"),
+                       cluster_sources=rows["id"].map(won["cluster_sources"]))
+        res[["id","cluster_id","key","domain","link","winner","cluster_size","cluster_sources"]].to_parquet(CLUSTERS+".parquet",index=False)
 
     df["rating"]=pd.to_numeric(df["rating"],errors="coerce")
     df["hourly_mid"]=pd.to_numeric(df["hourly_mid"],errors="coerce")
@@ -82,7 +136,14 @@ def main():
     df["team_mid"]=pd.to_numeric(df["team_mid"],errors="coerce")
     na_before=df[["rating","hourly_mid","min_project_usd","team_mid"]].isna().sum().to_dict()
 
-    r_med=float(df["rating"].median(skipna=True)) if df["rating"].notna().any() else None
+    agg=merge_aggregates(df,dbp()) if sql else None
+    if sql and agg is None:
+        print("merge: market_entries changed since clean_data read it, aggregates computed in pandas")
+
+    if agg is not None:
+        r_med=agg[0]
+    else:
+        r_med=float(df["rating"].median(skipna=True)) if df["rating"].notna().any() else None
     if r_med is not None:
         df["rating"]=df["rating"].fillna(r_med)
     na_after_rating=int(df["rating"].isna().sum())
@@ -90,28 +151,30 @@ def main():
     medians={}
     fills={}
     for col in ["hourly_mid","min_project_usd","team_mid"]:
-        gmed=df.groupby("source", dropna=True)[col].median()
-        gmed_dict={str(k):float(v) for k,v in gmed.dropna().items()}
-        glob=float(df[col].median(skipna=True)) if df[col].notna().any() else None
-        def _fill_grp(s):
-            m=gmed.get(s.name)
-            if pd.isna(m):
-                return s.fillna(glob)
-            return s.fillna(m)
-        df[col]=df.groupby("source")[col].transform(_fill_grp)
-        medians[col]={"group_medians":gmed_dict,"global_median":glob}
+        if agg is not None:
+            medians[col]=agg[1][col]
+        else:
+            gmed=df.groupby("source", dropna=True)[col].median()
+            medians[col]={"group_medians":{str(k):float(v) for k,v in gmed.dropna().items()},
+                          "global_median":float(df[col].median(skipna=True)) if df[col].notna().any() else None}
+        # the source's median, else the overall one
+        fill=df["source"].astype(str).map(medians[col]["group_medians"])
+        if medians[col]["global_median"] is not None:
+            fill=fill.fillna(medians[col]["global_median"])
+        df[col]=df[col].fillna(fill)
         fills[col]={"filled":int(max(0,na_before.get(col,0)-df[col].isna().sum())),"na_before":int(na_before.get(col,0)),"na_after":int(df[col].isna().sum())}
 
     fills["rating"]={"filled":int(max(0,na_before.get("rating",0)-na_after_rating)),"na_before":int(na_before.get("rating",0)),"na_after":na_after_rating,"global_median":r_med}
 
     clip_stats={}
     for col in ["hourly_mid","min_project_usd","team_mid"]:
-        df[col],st=clip_iqr_stats(df[col])
+        df[col],st=clip_iqr_stats(df[col],agg[2][col] if agg is not None else None)
         clip_stats[col]=st
 
     df["price_segment"]=df["hourly_mid"].apply(seg)
 
-    df.to_csv("outputs/merged.csv",index=False)
+    typed=save(df,"outputs/merged")
+    to_csv(df,"outputs/merged.csv")
     to_xml(df,"outputs/merged.xml")
 
     ch={}
@@ -121,6 +184,7 @@ def main():
     ch["duplicates_removed"]=duplicates_removed
     ch["sources"]=src_counts
     ch["top_duplicate_names"]=dup_list
+    ch["entity_resolution"]=er
     ch["imputations"]=fills
     ch["medians_used"]=medians
     ch["iqr_clipping"]=clip_stats
@@ -135,12 +199,16 @@ def main():
         f.write(f"- rows_in: {ch['rows_in']}\n")
         f.write(f"- rows_after_dedup: {ch['rows_after_dedup']}\n")
         f.write(f"- duplicates_removed: {ch['duplicates_removed']}\n")
+        f.write(f"- entity_resolution: {json.dumps({k:er[k] for k in ['clusters','multi_record_clusters','cross_source_clusters','links']})}\n")
         f.write(f"- sources: {json.dumps(ch['sources'])}\n")
         f.write(f"- imputations: {json.dumps(ch['imputations'])}\n")
         f.write(f"- iqr_clipping: {json.dumps(ch['iqr_clipping'])}\n")
         f.write(f"- segments: {json.dumps(ch['segments'])}\n")
 
+    if last_run is not None:
+        write_state("merge",version=VERSION,clean_run=last_run)
     print("ok")
+    return typed
 
 if __name__=="__main__":
     main()
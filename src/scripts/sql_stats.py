@@ -0,0 +1,143 @@
+import io, sys, math, psycopg2, pandas as pd
+from contextlib import contextmanager
+
+# --sql mode of clean_data and merge_tables: the aggregates come back from Postgres, computed over
+# the generated columns of market_entries (migration 0003), instead of being worked out in pandas.
+# Each query also reports which rows it saw; when that is not the frame being written (the table
+# moved on since it was read) the caller falls back to pandas.
+
+NUMERIC=["rating","reviews_count","hourly_low","hourly_high","hourly_mid","min_project_usd","team_low","team_high","team_mid"]
+OUTLIERS=["rating","reviews_count","hourly_mid","team_mid","min_project_usd"]
+TEXTS=["hourly_rate","min_project_size","team_size"]
+
+CLEAN="""
+WITH c AS (
+    SELECT regexp_replace(company_name, '^\\s+|\\s+$', '', 'g') AS company_name, source, rating,
+           coalesce(reviews_count, 0)::float8 AS reviews_count, hourly_rate, min_project_size, team_size,
+           hourly_low, hourly_high, hourly_mid, min_project_usd, team_low, team_high, team_mid, updated_at
+    FROM market_entries
+    WHERE company_name ~ '\\S'
+)
+"""
+
+SUMMARY=CLEAN+"""
+SELECT count(*), max(updated_at), count(DISTINCT company_name),
+       (SELECT count(*) FROM (SELECT DISTINCT company_name, source FROM c) d),
+       count(*) FILTER (WHERE source <> ''), count(rating),
+       count(hourly_rate), count(min_project_size), count(team_size),
+       count(*) FILTER (WHERE hourly_rate <> ''), count(*) FILTER (WHERE min_project_size <> ''),
+       count(*) FILTER (WHERE team_size <> '')
+FROM c
+"""
+
+BY_SOURCE=CLEAN+"SELECT source, count(*) FROM c GROUP BY source ORDER BY count(*) DESC, source"
+
+# one scan for every column: counts, moments and the three quartiles from a single sort each
+COLUMNS=CLEAN+"SELECT "+", ".join(
+    f"count({k}), avg({k}), min({k}), max({k}), stddev_samp({k}), percentile_cont(ARRAY[0.25, 0.5, 0.75]) WITHIN GROUP (ORDER BY {k})"
+    for k in NUMERIC)+" FROM c"
+
+OUTSIDE=CLEAN+"SELECT "+", ".join(f"count(*) FILTER (WHERE {k} < %({k}_lo)s OR {k} > %({k}_hi)s)" for k in OUTLIERS)+" FROM c"
+
+@contextmanager
+def cursor(params):
+    try:
+        with psycopg2.connect(**params) as c:
+            with c.cursor() as cur:
+                yield cur
+    except psycopg2.errors.UndefinedColumn:
+        sys.exit("--sql needs the generated columns of migration 0003: run make migrate")
+
+def _float(v):
+    return None if v is None else float(v)
+
+def clean_meta(df,params):
+    # the clean_raw_meta.json fields clean_data works out from df, or None when the table is not df
+    with cursor(params) as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cur.execute(SUMMARY)
+        n,last,names,pairs,source,rating,*texts=cur.fetchone()
+        if n!=len(df) or (n and "updated_at" in df and pd.Timestamp(last)!=df["updated_at"].max()):
+            return None
+        cur.execute(BY_SOURCE)
+        by_source=dict(cur.fetchall())
+        cur.execute(COLUMNS)
+        row=cur.fetchone()
+        columns={k:row[6*i:6*i+6] for i,k in enumerate(NUMERIC)}
+        bounds={}
+        for k in OUTLIERS:
+            q=columns[k][5]
+            iqr=q[2]-q[0] if q else 0
+            bounds[k]=(q[0]-1.5*iqr,q[2]+1.5*iqr) if q else (0,0)
+        cur.execute(OUTSIDE,{f"{k}_{e}":b[j] for k,b in bounds.items() for j,e in enumerate(["lo","hi"])})
+        outside=dict(zip(OUTLIERS,cur.fetchone()))
+    present=dict(zip(TEXTS,texts[:3]))
+    filled=dict(zip(TEXTS,texts[3:]))
+    share=lambda k: float(k/n) if n else math.nan
+    null_counts={"company_name":0,"source":0,"rating":n-rating,"reviews_count":0,
+                 **{c:n-present[c] for c in TEXTS},"locations":0,"services_offered":0}
+    completeness={"company_name":share(n),"source":share(source),"rating":share(rating),"reviews_count":share(n),
+                  **{c:share(filled[c]) for c in TEXTS},"locations":share(n),"services_offered":share(n)}
+    stats={}
+    for k in NUMERIC:
+        count,mean,lo,hi,std,q=columns[k]
+        some=count>0
+        stats[k]={"count":int(count),"mean":_float(mean) if some else None,"median":float(q[1]) if some else None,
+                  "min":_float(lo) if some else None,"max":_float(hi) if some else None,
+                  "std":(math.nan if std is None else float(std)) if some else None}
+    outliers={k:{"count":int(outside[k]),"lower":float(bounds[k][0]),"upper":float(bounds[k][1])} if columns[k][0]
+              else {"count":0,"lower":None,"upper":None} for k in OUTLIERS}
+    return {
+        "rows_total": int(n),
+        "unique_companies": int(names),
+        "possible_duplicates": int(n-pairs),
+        "by_source": by_source,
+        "null_counts": null_counts,
+        "completeness": completeness,
+        "numeric_stats": stats,
+        "outliers_1_5_IQR": outliers,
+    }
+
+FILLED=["hourly_mid","min_project_usd","team_mid"]
+
+MERGE="""
+WITH w AS (
+    SELECT e.source, e.rating, e.hourly_mid, e.min_project_usd, e.team_mid
+    FROM merge_winners k
+    JOIN market_entries e ON e.id = k.id AND e.updated_at IS NOT DISTINCT FROM k.updated_at
+), g AS (
+    SELECT source, {group} FROM w GROUP BY source
+), a AS (
+    SELECT count(*) n, percentile_cont(0.5) WITHIN GROUP (ORDER BY rating) rating, {group} FROM w
+), f AS (
+    -- the values after merge_tables fills the gaps: source median, else the overall one
+    SELECT {fill} FROM w JOIN g USING (source) CROSS JOIN a
+)
+SELECT (SELECT n FROM a), (SELECT rating FROM a), (SELECT json_agg(g ORDER BY source) FROM g), (SELECT row_to_json(a) FROM a), {quartiles} FROM f
+"""
+
+def merge_query():
+    group=", ".join(f"percentile_cont(0.5) WITHIN GROUP (ORDER BY {c}) {c}" for c in FILLED)
+    fill=", ".join(f"coalesce(w.{c}, g.{c}, a.{c}) {c}" for c in FILLED)
+    quartiles=", ".join(f"percentile_cont(0.25) WITHIN GROUP (ORDER BY {c}), percentile_cont(0.75) WITHIN GROUP (ORDER BY {c})" for c in FILLED)
+    return MERGE.format(group=group,fill=fill,quartiles=quartiles)
+
+def merge_aggregates(df,params):
+    # medians and post-fill quartiles merge_tables needs for the winners in df, or None when
+    # their rows changed in the table since clean_data read them
+    if "updated_at" not in df:
+        return None
+    # the winners go over as a COPY; a parameter array of this size costs more to send than to use
+    buf=io.StringIO()
+    df[["id","updated_at"]].to_csv(buf,index=False,header=False)
+    buf.seek(0)
+    with cursor(params) as cur:
+        cur.execute("CREATE TEMP TABLE merge_winners (id int PRIMARY KEY, updated_at timestamp) ON COMMIT DROP")
+        cur.copy_expert("COPY merge_winners FROM STDIN WITH (FORMAT csv)",buf)
+        cur.execute(merge_query())
+        n,rating,groups,overall,*q=cur.fetchone()
+    if n!=len(df):
+        return None
+    medians={c:{"group_medians":{g["source"]:g[c] for g in groups or [] if g[c] is not None},"global_median":overall[c]} for c in FILLED}
+    quartiles={c:(q[2*i],q[2*i+1]) for i,c in enumerate(FILLED)}
+    return rating,medians,quartiles
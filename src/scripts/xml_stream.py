@@ -0,0 +1,68 @@
+from xml.sax.saxutils import escape
+
+# Incremental XML output: each row goes straight to the file, so memory does not grow
+# with the document. Compact mode writes the same bytes ElementTree.write did (declaration,
+# no whitespace, "<tag />" when empty); pretty mode is export_data's indented layout.
+class XmlStream:
+    def __init__(self, f, root, item, pretty=False, declaration=True):
+        self.f = f
+        self.root = root
+        self.pretty = pretty
+        self.open_item, self.close_item = (f"  <{item}>\n", f"  </{item}>\n") if pretty else (f"<{item}>", f"</{item}>")
+        if declaration:
+            f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(f"<{root}>\n" if pretty else f"<{root}>")
+
+    def leaf(self, tag, text):
+        if self.pretty:
+            return f"    <{tag}>{text}</{tag}>\n"
+        return f"<{tag}>{text}</{tag}>" if text else f"<{tag} />"
+
+    def element(self, tag, v, child=None):
+        if child is None:
+            return self.leaf(tag, escape(str(v)))
+        inner = "".join(self.leaf(child, escape(str(x))) for x in v or [])
+        return f"<{tag}>{inner}</{tag}>" if inner else f"<{tag} />"
+
+    def write(self, fields):
+        # fields: (tag, value, child) triples; child names the element each item of a list value gets
+        self.write_elements([self.element(*f) for f in fields])
+
+    def write_elements(self, elements):
+        self.f.write(self.open_item + "".join(elements) + self.close_item)
+
+    def close(self):
+        self.f.write(f"</{self.root}>\n" if self.pretty else f"</{self.root}>")
+
+def open_xml(path):
+    return open(path, "w", encoding="utf-8", errors="xmlcharrefreplace")
+
+def _chunk(values, start, stop):
+    return values.iloc[start:stop].tolist() if hasattr(values, "iloc") else list(values[start:stop])
+
+def write_columns(path, root, item, fields, n, chunk=10000):
+    # fields: (tag, values) for text or (tag, values, child) for list columns; values are
+    # column arrays of length n, turned into elements a chunk of rows at a time
+    with open_xml(path) as f:
+        x = XmlStream(f, root, item)
+        # most text columns repeat a few values: remember their elements, up to a point
+        seen = [{} for _ in fields]
+        for start in range(0, n, chunk):
+            columns = []
+            for (tag, values, *child), memo in zip(fields, seen):
+                if child:
+                    columns.append([x.element(tag, v, child[0]) for v in _chunk(values, start, start + chunk)])
+                    continue
+                out = []
+                for v in _chunk(values, start, start + chunk):
+                    k = str(v)
+                    e = memo.get(k)
+                    if e is None:
+                        e = x.leaf(tag, escape(k))
+                        if len(memo) < 10000:
+                            memo[k] = e
+                    out.append(e)
+                columns.append(out)
+            for row in zip(*columns):
+                x.write_elements(row)
+        x.close()